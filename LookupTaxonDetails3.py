@@ -3,11 +3,14 @@
 # Script from David Ryder (CEFAS, Weymouth, England)
 
 # Needs ete3 being installed and folder .etetoolkit being present in the home directory
+# Output is gzip or zstd compressed if its name ends with .gz or .zst (.zst needs
+# the python package zstandard)
 # If folder .etetoolkit is not present in home directory, you need to run ONLY
 # the ete3 command once first, delete the output, and then set -e to the
 # .etetoolit/taxa.sqlite folder that has now been generated in your folder.
 
-import getopt,sys,sqlite3,os
+import getopt,sys,sqlite3,os,functools,gzip,queue,threading
+from urllib.request import pathname2url
 
 # Retrieve file names from the command line
 def retrieveArguments():
@@ -16,12 +19,13 @@ def retrieveArguments():
   outputFileName=''
   etetoolkit=''
   taxonColumn=13
+  cacheSize=100000
 
-  myopts, args = getopt.getopt(sys.argv[1:],"b:l:o:t:e:")
+  myopts, args = getopt.getopt(sys.argv[1:],"b:l:o:t:e:s:")
 
-  helpMessage = "-b blast alignments -l taxonomic lineages -o output -t 13 -e etetoolkit"
+  helpMessage = "-b blast alignments -l taxonomic lineages -o output -t 13 -e etetoolkit [-s 100000 taxa to cache formatted taxonomy of]"
 
-  if len(myopts) != 5:
+  if len([o for o, a in myopts if o != '-s']) != 5:
     print("Usage: {} {}".format(sys.argv[0],helpMessage))
     exit();
 
@@ -36,87 +40,148 @@ def retrieveArguments():
       taxonColumn = int(a)
     elif o == '-e':
       etetoolkit = a
+    elif o == '-s':
+      cacheSize = int(a)
     else:
       print("Usage: {} {}".format(sys.argv[0],helpMessage))
       exit();
 
-  print("Lineage file: {}\nBlast alignment file: {}\nOutput file: {}\nColumn used to store taxonomic id: {}\netetoolkit/taxa.sqlite location: {}".format(lineageFileName,blastFileName,outputFileName,taxonColumn,etetoolkit))
-
-  return(lineageFileName,blastFileName,outputFileName,taxonColumn,etetoolkit)
-
-lineageFileName,blastFileName,outputFileName,taxonColumn,etetoolkit = retrieveArguments()
-
-# Read file containing results
+  print("Lineage file: {}\nBlast alignment file: {}\nOutput file: {}\nColumn used to store taxonomic id: {}\netetoolkit/taxa.sqlite location: {}\nNumber of taxa to cache formatted taxonomy of: {}".format(lineageFileName,blastFileName,outputFileName,taxonColumn,etetoolkit,cacheSize))
+
+  return(lineageFileName,blastFileName,outputFileName,taxonColumn,etetoolkit,cacheSize)
+
+# Look up the ranks of taxa in batches of IN (...) queries, so that the database
+# is only queried once per batch of distinct taxa instead of once per lineage entry
+def retrieveRanks(c,taxa,batchSize=900):
+  taxon2Rank = dict()
+  taxa = list(taxa)
+  for i in range(0,len(taxa),batchSize):
+    batch = taxa[i:i + batchSize]
+    c.execute('SELECT taxid, rank FROM species WHERE taxid IN ({})'.format(','.join('?' * len(batch))),batch)
+    for taxon,rank in c.fetchall():
+      taxon2Rank[str(taxon)] = rank.strip('\t')
+  return(taxon2Rank)
+
+# Open output file for writing, compressed based on its name
+def openOutput(outputFileName):
+  if outputFileName.endswith('.gz'):
+    return(gzip.open(outputFileName,'wb',compresslevel=6))
+  elif outputFileName.endswith('.zst'):
+    import zstandard
+    return(zstandard.ZstdCompressor().stream_writer(open(outputFileName,'wb')))
+  return(open(outputFileName,'wb'))
+
+# Collect output lines into large batches and hand them to a separate thread that
+# writes (and compresses) them, so that writing overlaps with assembling the next
+# batch instead of writing every field on its own
+class BatchWriter:
+  def __init__(self,outputFileName,batchSize=10000):
+    self.outputFile = openOutput(outputFileName)
+    self.batchSize = batchSize
+    self.batch = []
+    self.batches = queue.Queue(maxsize=4)
+    self.error = None
+    self.thread = threading.Thread(target=self.writeBatches,daemon=True)
+    self.thread.start()
+
+  def writeBatches(self):
+    try:
+      while True:
+        batch = self.batches.get()
+        if batch is None:
+          break
+        self.outputFile.write(batch)
+    except Exception as e:
+      self.error = e
+      # Keep emptying the queue so that the main thread doesn't block
+      while self.batches.get() is not None:
+        pass
+    finally:
+      self.outputFile.close()
+
+  def write(self,line):
+    self.batch.append(line)
+    if len(self.batch) == self.batchSize:
+      self.flush()
+
+  def flush(self):
+    if self.batch:
+      self.batches.put("".join(self.batch).encode())
+      self.batch = []
+
+  def close(self):
+    self.flush()
+    self.batches.put(None)
+    self.thread.join()
+    if self.error:
+      raise self.error
+
+lineageFileName,blastFileName,outputFileName,taxonColumn,etetoolkit,cacheSize = retrieveArguments()
+
+# Read file containing results and group its lines by taxid, lines that are
+# repeated (ete3 is run in chunks) are only kept once. Lines are only split into
+# ranks when the taxonomy of their taxid is formatted
+lineageRows = dict()
+distinctTaxa = set()
 lineageFile = open(lineageFileName,'r')
-
-# Open file for writting out results
-outputFile = open(outputFileName,'w')
-
-# Create a connection to the database
-conn = sqlite3.connect(etetoolkit.format(os.getlogin()))
-
-c = conn.cursor()
-c.execute("PRAGMA foreign_keys=ON")
-
-taxonomicLineage = dict()
-taxon2SpeciesName = dict()
-
 for line in lineageFile:
   line = line.strip('\n')
-  splitLine = line.split('\t');
-  taxonID = splitLine[0];
-  SpeciesName = splitLine[1];
-  LowestLevel = splitLine[2];
-  lineage = splitLine[3];
-  lineageSplit = lineage.split(',');
-  taxonLineage = splitLine[4];
-  taxonLineageSplit = taxonLineage.split(',');
-
-  taxonLineageRank = []
-
-  if taxonID not in taxon2SpeciesName:
-    taxon2SpeciesName[taxonID] = [LowestLevel,SpeciesName]
-
-  #print(line)
-  for taxon in taxonLineageSplit:
-    c.execute('SELECT rank FROM species WHERE taxid = ?',[taxon])
-    #print("\t{}".format(taxon))
-    result = c.fetchone()
-    if result:
-      taxonRank = result[0].strip('\t')
-    else:
-      taxonRank = 'No Result'
-    #print("TaxonID:{}\nTaxon Rank:{}\n".format(taxon,taxonRank))
+  splitLine = line.split('\t')
+  rows = lineageRows.setdefault(splitLine[0],[])
+  if line not in rows:
+    rows.append(line)
+    distinctTaxa.update(splitLine[4].split(','))
+lineageFile.close()
 
-    taxonLineageRank.append(taxonRank)
+# Create a read-only connection to the database
+conn = sqlite3.connect('file:{}?mode=ro'.format(pathname2url(etetoolkit.format(os.getlogin()))),uri=True)
 
-  for i in range(1,len(taxonLineageSplit)):
-    #outputFile.write("{}\t{}\t{}\t{}\n".format(taxonID,LowestLevel,lineageSplit[i],taxonLineageRank[i]))
+c = conn.cursor()
+c.execute("PRAGMA foreign_keys=ON")
+c.execute("PRAGMA mmap_size=1073741824")
+c.execute("PRAGMA cache_size=-262144")
 
-    if taxonID in taxonomicLineage:
-      taxonomicLineage[taxonID][taxonLineageRank[i]] = lineageSplit[i]
-    else:
-      taxonomicLineage[taxonID] = {taxonLineageRank[i]: lineageSplit[i]}
+# Look up the ranks of all distinct taxa of all lineages at once
+taxon2Rank = retrieveRanks(c,distinctTaxa)
+conn.close()
 
 blastFile = open(blastFileName,'r')
 taxonomicLevels = ['superkingdom','kingdom','phylum','subphylum','class','subclass','order','suborder','infraorder','family','genus']
 
-for line in blastFile:
-  line = line.strip('\n')
-  splitLine = line.split('\t');
-  taxonID = splitLine[taxonColumn-1].split(';')[0]
-
-  outputFile.write(line)
-
-  if (taxonID in taxonomicLineage):
-    outputFile.write("\t{}\t{}".format(taxon2SpeciesName[taxonID][0],taxon2SpeciesName[taxonID][1]))
-
+# Format the taxonomy columns appended to the hits of a taxon from the lineage
+# lines of the taxon. Most hits share a small set of taxa, so formatted
+# taxonomies are kept in a cache of limited size that drops the least recently
+# used taxa first, and are the only taxonomy kept per taxon
+@functools.lru_cache(maxsize=cacheSize)
+def formatTaxonomy(taxonID):
+  taxonomicLineage = dict()
+  for line in lineageRows.get(taxonID,[]):
+    splitLine = line.split('\t');
+    lineageSplit = splitLine[3].split(',');
+    taxonLineageSplit = splitLine[4].split(',');
+
+    for i in range(1,len(taxonLineageSplit)):
+      taxonomicLineage[taxon2Rank.get(taxonLineageSplit[i],'No Result')] = lineageSplit[i]
+
+  if taxonomicLineage:
+    splitLine = lineageRows[taxonID][0].split('\t');
+    taxonomy = "\t{}\t{}".format(splitLine[2],splitLine[1])
     for level in taxonomicLevels:
-      if (level in taxonomicLineage[taxonID]):
-        outputFile.write("\t{}".format(taxonomicLineage[taxonID][level]))
-      else:
-        outputFile.write("\tNA")
-  else:
-    for i in range(0,len(taxonomicLevels) + 2):
-      outputFile.write("\tUnknown")
-  outputFile.write("\n")
+      taxonomy += "\t{}".format(taxonomicLineage.get(level,'NA'))
+    return(taxonomy)
+  return("\tUnknown" * (len(taxonomicLevels) + 2))
+
+# Open file for writting out results. The writer is closed even if a line can't
+# be processed, so that its thread stops and the error is raised
+outputFile = BatchWriter(outputFileName)
+
+try:
+  for line in blastFile:
+    line = line.strip('\n')
+    splitLine = line.split('\t');
+    taxonID = splitLine[taxonColumn-1].split(';')[0]
+
+    outputFile.write("{}{}\n".format(line,formatTaxonomy(taxonID)))
+finally:
+  blastFile.close()
+  outputFile.close()
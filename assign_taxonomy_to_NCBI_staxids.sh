@@ -15,20 +15,29 @@
 # Note that if ete3 is installed with conda, you have to activate the environment
 # when running ete3
 
-usage="$(basename "$0") -b <blast_file> -c <n> -e <path/to/.etetoolkit/taxa.sqlite>
+# Alternatively, a taxonomy index can be built once with taxonomy_index.py
+# (taxonomy_index.py build -s ~/.etetoolkit/taxa.sqlite -o taxonomy_index) and
+# given with -x, then taxonomy is assigned without ete3 and LookupTaxonDetails3.py
+
+usage="$(basename "$0") -b <blast_file> -c <n> <-e <path/to/.etetoolkit/taxa.sqlite>|-x <path/to/taxonomy_index>>
 
 Usage:
 	-b  Blast file including column with NCBI staxids
 	-c  Number of the column containing NCBI staxids
 	-e  Path to ~/.etetoolkit/taxa.sqlite
+	-x  Path to taxonomy index made with taxonomy_index.py (replaces -e)
 	-h  Display this help and exit"
 
+# Make pipelines fail if any of their commands fails
+set -o pipefail
+
 # Set specified options
-while getopts ':b:c:e:h' opt; do
+while getopts ':b:c:e:x:h' opt; do
 	case "${opt}" in
 	b) blast_file="${OPTARG}" ;;
 	c) column="${OPTARG}" ;;
 	e) etetoolkit="${OPTARG}" ;;
+	x) taxonomy_index="${OPTARG}" ;;
 	h)
 		echo "$usage"
 		exit
@@ -48,8 +57,8 @@ done
 shift $((OPTIND - 1))
 
 # Check if required options are set
-if [[ -z "$blast_file" || -z "$column" || -z "$etetoolkit" ]]; then
-	echo -e "-b, -c, and -e must be set.\n"
+if [[ -z "$blast_file" || -z "$column" || (-z "$etetoolkit" && -z "$taxonomy_index") ]]; then
+	echo -e "-b, -c, and -e or -x must be set.\n"
 	echo -e "$usage\n\n"
 	echo -e "Exiting script.\n"
 	exit
@@ -58,19 +67,28 @@ fi
 # Making name for output variable:
 blast_file_out_tmp=${blast_file%.*}_with_taxonomy.txt
 blast_file_out=$(echo ${blast_file_out_tmp##*/})
-# The ete3 command doesn't work on large files so we're splitting it up into
-# chunks of 10000 lines:
-touch matching_lineages.tsv
-cut -f $column $blast_file >tmp
-split -l 100000 tmp tmp_chunk_
-for id in tmp_chunk_*; do
-	ete3 ncbiquery --info --search $(cat $id) >>matching_lineages.tsv
-done
-sed -i '1!{/^#/d;}' matching_lineages.tsv
-# Running subscript:
-LookupTaxonDetails3.py -b $blast_file -l matching_lineages.tsv \
-	-o $blast_file_out -t $column -e $etetoolkit
-echo 'qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore staxid lowest_rank lowest_hit superkingdom kingdom phylum subphylum class subclass order suborder infraorder family genus' |
-	sed -e 's/ /\t/g' | cat - $blast_file_out >tmp2 && mv tmp2 $blast_file_out
+if [[ -n "$taxonomy_index" ]]; then
+	# Looking up lineages in the taxonomy index:
+	taxonomy_index.py annotate -b $blast_file -c $column -x $taxonomy_index \
+		-o $blast_file_out
+else
+	# The ete3 command doesn't work on large files so we're splitting it up into
+	# chunks of 10000 lines:
+	touch matching_lineages.tsv
+	cut -f $column $blast_file >tmp
+	split -l 100000 tmp tmp_chunk_
+	for id in tmp_chunk_*; do
+		ete3 ncbiquery --info --search $(cat $id) >>matching_lineages.tsv
+	done
+	sed -i '1!{/^#/d;}' matching_lineages.tsv
+	# Running subscript:
+	LookupTaxonDetails3.py -b $blast_file -l matching_lineages.tsv \
+		-o $blast_file_out -t $column -e $etetoolkit
+fi &&
+	echo 'qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore staxid lowest_rank lowest_hit superkingdom kingdom phylum subphylum class subclass order suborder infraorder family genus' |
+		sed -e 's/ /\t/g' | cat - $blast_file_out >tmp2 && mv tmp2 $blast_file_out
+# Keep the exit status, so that a failed lookup isn't taken as a finished one
+status=$?
 
-rm matching_lineages.tsv tmp*
+rm -f matching_lineages.tsv tmp*
+exit $status
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+"""
+A script to benchmark reading hit tables in .csv, .parquet and .arrow format
+with blast_filter.read_hits: a synthetic BLAST hit table with taxonomy (17
+columns, ranks written as dictionary-encoded columns in .parquet/.arrow format)
+is written in each format, and the time to read the 11 columns blast_filter.py
+needs (req_cols) and the file size are reported per format. Needs pyarrow.
+
+Usage: python benchmarks/bench_columnar_io.py [-n 1000000 -d bench_io]
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from blast_filter import read_hits
+
+# Define the ranks of the table, of which blast_filter.py reads the default ranks
+table_ranks = [
+    "superkingdom",
+    "kingdom",
+    "phylum",
+    "subphylum",
+    "class",
+    "subclass",
+    "order",
+    "suborder",
+    "infraorder",
+    "family",
+    "genus",
+    "species",
+]
+ranks = ["superkingdom", "phylum", "class", "order", "family", "genus", "species"]
+req_cols = ["qseqid", "pident", "length", "bitscore"] + ranks
+
+
+# Define function to make a hit table of n_hits hits of n_hits / 20 qseqids,
+# grouped by qseqid, with 5 % missing and 0.2 % "Unknown" taxa per rank
+def synthetic_hits(n_hits, seed):
+    rng = np.random.default_rng(seed)
+    n_queries = max(1, n_hits // 20)
+    queries = np.sort(rng.integers(0, n_queries, n_hits))
+    df = pd.DataFrame(
+        {
+            "qseqid": np.array([f"contig_{i}" for i in range(n_queries)])[queries],
+            "sseqid": [f"acc{i}" for i in rng.integers(0, 1000, n_hits)],
+            "pident": np.round(rng.uniform(70, 100, n_hits), 3),
+            "length": rng.integers(50, 500, n_hits),
+            "bitscore": rng.choice([140.0, 150.0, 155.0, 200.0, 201.0, 300.0, 305.5], n_hits),
+        }
+    )
+    base = rng.integers(0, 40, n_hits)
+    for i, rank in enumerate(table_ranks):
+        taxa = np.array([f"{rank[:3].capitalize()}{j}" for j in range(60)], dtype=object)
+        column = taxa[(base // (13 - i)) % 60 + rng.integers(0, 2, n_hits) * (i > 8)]
+        if rank == "species":
+            column = np.array(
+                [
+                    f"Genus{taxon} sp{taxon} strainX" if j % 3 else f"uncultured {taxon}"
+                    for j, taxon in enumerate(column)
+                ],
+                dtype=object,
+            )
+        column[rng.random(n_hits) < 0.05] = None
+        column[rng.random(n_hits) < 0.002] = "Unknown"
+        df[rank] = column
+    return df
+
+
+# Define function to time reading a file, best of repeats
+def read_time(file, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        read_hits(file, req_cols, ranks)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+parser = argparse.ArgumentParser(description="Benchmark reading hit tables per format.")
+parser.add_argument("-n", "--hits", default=1000000, type=int, help="Number of hits (default=1000000).")
+parser.add_argument("-d", "--dir", default="bench_io", help="Directory for the files (default=bench_io).")
+parser.add_argument("-r", "--repeats", default=3, type=int, help="Number of reads per format (default=3).")
+parser.add_argument("-s", "--seed", default=1, type=int, help="Random seed (default=1).")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    os.makedirs(args.dir, exist_ok=True)
+    df = synthetic_hits(args.hits, args.seed)
+    encoded = df.astype({rank: "category" for rank in table_ranks})
+    files = {
+        "csv": os.path.join(args.dir, "hits.csv"),
+        "parquet": os.path.join(args.dir, "hits.parquet"),
+        "arrow": os.path.join(args.dir, "hits.arrow"),
+    }
+    df.to_csv(files["csv"], index=False)
+    encoded.to_parquet(files["parquet"], index=False)
+    encoded.to_feather(files["arrow"])
+
+    print(f"{len(df)} hits, {df.shape[1]} columns, reading {len(req_cols)} columns")
+    for name, file in files.items():
+        size = os.path.getsize(file) / 2**20
+        print(f"{name:8} {read_time(file, args.repeats):5.2f} s  {size:4.0f} MB")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+"""
+A script to benchmark the bitscore window of the strict mode of blast_filter.py
+(hits with bitscore >= max - max * percentage of their qseqid) on a synthetic
+hit table: the previous groupby transform of bitscore_cutoff() per qseqid
+against the current groupby transform("max"). Both have to keep the same hits.
+
+Usage: python benchmarks/bench_strict_bitscore.py [-n 10000000 -q 500000]
+"""
+
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+
+# Define function to filter bitscores, as previously used in strict mode
+def bitscore_cutoff(x):
+    min_bitscore = x.max() - x.max() * 0.02
+    return x[x >= min_bitscore]
+
+
+# Define function to make a hit table of n_hits hits of n_queries qseqids,
+# grouped by qseqid as BLAST output
+def synthetic_hits(n_hits, n_queries, seed):
+    rng = np.random.default_rng(seed)
+    qseqids = np.sort(rng.integers(0, n_queries, n_hits))
+    return pd.DataFrame(
+        {
+            "qseqid": pd.Index(qseqids).map(lambda i: f"q{i}"),
+            "bitscore": rng.integers(100, 500, n_hits).astype(float),
+        }
+    )
+
+
+# Define function to time a function
+def timed(function, df):
+    start = time.perf_counter()
+    mask = function(df)
+    return mask, time.perf_counter() - start
+
+
+def old_window(df):
+    return df.groupby(["qseqid"])["bitscore"].transform(bitscore_cutoff) == df["bitscore"]
+
+
+def new_window(df, percentage=0.02):
+    max_bitscore = df.groupby(["qseqid"])["bitscore"].transform("max")
+    return df["bitscore"] >= max_bitscore - max_bitscore * percentage
+
+
+parser = argparse.ArgumentParser(description="Benchmark the strict bitscore window.")
+parser.add_argument("-n", "--hits", default=10000000, type=int, help="Number of hits (default=10000000).")
+parser.add_argument("-q", "--queries", default=500000, type=int, help="Number of qseqids (default=500000).")
+parser.add_argument("-s", "--seed", default=1, type=int, help="Random seed (default=1).")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    df = synthetic_hits(args.hits, args.queries, args.seed)
+    print(f"{len(df)} hits, {df['qseqid'].nunique()} qseqids")
+    new_mask, new_time = timed(new_window, df)
+    print(f"transform(\"max\"):            {new_time:.2f} s, {new_mask.sum()} hits kept")
+    old_mask, old_time = timed(old_window, df)
+    print(f"transform(bitscore_cutoff): {old_time:.2f} s, {old_mask.sum()} hits kept")
+    assert (old_mask == new_mask).all(), "windows keep different hits"
+    print(f"Identical hits kept, speedup {old_time / new_time:.0f}x")
@@ -6,14 +6,35 @@ A script to filter BLAST hits with assigned taxonomy.
 By Chris Hempel (christopher.hempel@kaust.edu.sa) on 20 Jan 2022
 """
 
+import os
 import datetime
+import numpy as np
 import pandas as pd
 import argparse
 import warnings
+import multiprocessing
+from functools import partial
 
 # Define that warnings are not printed to console
 warnings.filterwarnings("ignore")
 
+# Define file extensions that are read and written as columnar files (requires
+# pyarrow), all other files are treated as .csv
+parquet_extensions = (".parquet", ".pq")
+arrow_extensions = (".arrow", ".feather", ".ipc")
+
+# Define the ranks that are set to "NA" if a hit's pident is below the respective
+# similarity cutoff, in the order of the cutoffs (species, genus, family, order,
+# class, phylum)
+cutoff_ranks = [
+    ["species"],
+    ["genus"],
+    ["family"],
+    ["order", "suborder", "infraorder"],
+    ["class", "subclass"],
+    ["phylum", "subphylum"],
+]
+
 
 # Define funtion to print datetime and text
 def time_print(text):
@@ -21,10 +42,281 @@ def time_print(text):
     print(f"{datetime_now}  ---  " + text)
 
 
-# Define function to filter bitscores
-def bitscore_cutoff(x):
-    min_bitscore = x.max() - x.max() * 0.02
-    return x[x >= min_bitscore]
+# Define function to make the LCA mask: every rank is factorized into integer
+# codes once, and a rank of a qseqid is True (= more than one taxon) if the
+# min and max code of its hits differ
+def lca_mask(df, ranks):
+    qseqid_codes = pd.factorize(df["qseqid"])[0]
+    rank_codes = pd.DataFrame(
+        {
+            rank: (
+                df[rank].cat.codes
+                if isinstance(df[rank].dtype, pd.CategoricalDtype)
+                else pd.factorize(df[rank])[0]
+            )
+            for rank in ranks
+        },
+        index=df.index,
+    )
+    grouped_codes = rank_codes.groupby(qseqid_codes, sort=False)
+    return grouped_codes.transform("min") != grouped_codes.transform("max")
+
+
+# Define function to encode ranks as categoricals that share one taxon dictionary,
+# so that ranks are held as integer codes throughout filtering and only decoded
+# into taxon names when written out. The dictionary always contains "NA" and can
+# be passed on to be extended by the next chunk
+def encode_ranks(df, ranks, taxa=None):
+    if taxa is None:
+        taxa = pd.Index(["NA"], dtype=object)
+    df = df.astype({rank: "category" for rank in ranks})
+    for rank in ranks:
+        new_taxa = df[rank].cat.categories.astype(object)
+        taxa = taxa.append(new_taxa[~new_taxa.isin(taxa)])
+    df = df.assign(**{rank: df[rank].cat.set_categories(taxa) for rank in ranks})
+    return df, taxa
+
+
+# Define function to find hits with any rank containing "Unknown" (= taxid could
+# not be translated). Each taxon of the dictionary is only checked once, and hits
+# are then looked up by their integer codes
+def unknown_mask(df, ranks):
+    taxa = df[ranks[0]].cat.categories
+    unknown_taxa = np.append(taxa.str.contains("Unknown"), False)  # code -1 = NaN
+    rank_codes = np.column_stack([df[rank].cat.codes for rank in ranks])
+    return unknown_taxa[rank_codes].any(axis=1)
+
+
+# Define function to make the rank -> cutoff table of the similarity cutoff from
+# cutoffs given in the order of cutoff_ranks (species, genus, family, order,
+# class, phylum)
+def cutoff_table(cutoffs, cutoff_ranks=cutoff_ranks):
+    return {
+        rank: cutoff for cutoff, ranks in zip(cutoffs, cutoff_ranks) for rank in ranks
+    }
+
+
+# Define function to apply the similarity cutoff: ranks of hits are set to "NA" if
+# the hits' pident is below the cutoff of the rank in the rank -> cutoff table.
+# All ranks are masked in one pass over the hits, ranks of the table that are not
+# in df are skipped, and the order of hits is kept
+def similarity_cutoff(df, rank_cutoffs):
+    ranks = [rank for rank in rank_cutoffs if rank in df.columns]
+    below = df["pident"].to_numpy()[:, None] < np.array(
+        [rank_cutoffs[rank] for rank in ranks], dtype=float
+    )
+    return df.assign(
+        **{rank: df[rank].mask(below[:, i], "NA") for i, rank in enumerate(ranks)}
+    )
+
+
+# Define function to read in record batches of a .parquet or .arrow file as
+# chunks, numbered continuously like the chunks of a .csv file
+def read_columnar_chunks(file, req_cols, chunksize):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if file.endswith(parquet_extensions):
+        batches = pq.ParquetFile(file).iter_batches(
+            batch_size=chunksize, columns=req_cols
+        )
+    else:
+        table = pa.ipc.open_file(pa.memory_map(file)).read_all().select(req_cols)
+        batches = table.to_batches(max_chunksize=chunksize)
+    start = 0
+    for batch in batches:
+        chunk = batch.to_pandas()
+        chunk.index = pd.RangeIndex(start, start + len(chunk))
+        start += len(chunk)
+        yield chunk
+
+
+# Define function to read in the hit table, either in full or, if chunksize is
+# given, as an iterator of chunks. Ranks are read in as categoricals, and
+# columnar files only have the required columns read in
+def read_hits(file, req_cols, ranks, chunksize=None):
+    if file.endswith(parquet_extensions + arrow_extensions):
+        if chunksize:
+            return read_columnar_chunks(file, req_cols, chunksize)
+        if file.endswith(parquet_extensions):
+            return pd.read_parquet(file, columns=req_cols)
+        return pd.read_feather(file, columns=req_cols)
+    return pd.read_csv(
+        file,
+        index_col=False,
+        usecols=req_cols,
+        dtype={"qseqid": str, "bitscore": float, "pident": float}
+        | {rank: "category" for rank in ranks},
+        chunksize=chunksize,
+    )
+
+
+# Define function to read in the hit table in chunks that only contain complete
+# qseqid groups. BLAST output is grouped by qseqid, so the trailing group of each
+# chunk is carried over to the next chunk, as it might continue there. All chunks
+# share one growing taxon dictionary
+def read_hit_groups(file, req_cols, ranks, chunksize):
+    carry = None
+    taxa = None
+    for chunk in read_hits(file, req_cols, ranks, chunksize):
+        chunk, taxa = encode_ranks(chunk, ranks, taxa)
+        chunk = chunk.fillna("NA")
+        if carry is not None:
+            carry, taxa = encode_ranks(carry, ranks, taxa)
+            chunk = pd.concat([carry, chunk])
+        if chunk.empty:
+            carry = chunk
+            continue
+        last_group = chunk["qseqid"] == chunk["qseqid"].iloc[-1]
+        carry = chunk[last_group]
+        yield chunk[~last_group]
+    if carry is not None:
+        yield carry
+
+
+# Define function to filter the hits of complete qseqid groups and apply the LCA
+def filter_hits(
+    df,
+    filter_mode,
+    ranks,
+    cutoff,
+    percentage,
+    length,
+    bitscore_threshold,
+    keep_pident,
+    verbose=True,
+):
+    # Drop rows containing "Unknown" = taxid could not be translated
+    df = df[~unknown_mask(df, ranks)]
+
+    if filter_mode == "soft":
+        if verbose:
+            time_print(
+                "Grouping qseqids and filtering hits based on the highest bitscore of each qseqid..."
+            )
+        idx = df.groupby(["qseqid"])["bitscore"].transform(max) == df["bitscore"]
+        df = df[idx]
+
+    elif filter_mode == "strict":
+        if verbose:
+            time_print("Filtering hits based on bitscore and length...")
+        df.loc[
+            (df["length"] < length) & (df["bitscore"] < bitscore_threshold), ranks
+        ] = "NA"
+
+        if verbose:
+            time_print(
+                "Grouping qseqids and filtering hits based on bitscore cutoff for each qseqid..."
+            )
+        max_bitscore = df.groupby(["qseqid"])["bitscore"].transform("max")
+        df = df[df["bitscore"] >= max_bitscore - max_bitscore * percentage]
+
+        if verbose:
+            time_print("Applying similarity cutoff...")
+        df = similarity_cutoff(df, cutoff_table(cutoff))
+
+    # Keep only relevant columns and put species to last column
+    df_tax = df[["qseqid"] + ranks]
+
+    ## Make a df mask: group dfs, check if ranks have more than one taxon, and if yes, True, else False
+    if verbose:
+        time_print("Performing LCA filter...")
+    ## Replace ranks in df with "NA" based on mask
+    df_tax = df_tax.mask(lca_mask(df_tax, ranks), "NA")
+
+    # Add qseqid info
+    df_tax["qseqid"] = df["qseqid"]
+
+    if keep_pident == "yes":
+        # Add pident info
+        df_tax["pident"] = df["pident"]
+
+    ## Drop duplicate rows == aggregate taxonomic info
+    df = df_tax.drop_duplicates()
+
+    if keep_pident == "yes":
+        # Per OTU and identical taxon match, keep the max pident
+        idx_pident = (
+            df.groupby(["qseqid"] + ranks, observed=True)["pident"].transform(max)
+            == df["pident"]
+        )
+        df = df[idx_pident]
+        df = df.rename(columns={"pident": "percentage_similarity"})
+
+    # Change column name
+    return df.rename(columns={"qseqid": "sequence_name"})
+
+
+# Define function to filter hits across a pool of worker processes. Hits are
+# hash-partitioned by qseqid into one shard per worker, so that every qseqid group
+# is filtered as a whole, and the filtered shards are put back into input order
+# via the row index, which is kept throughout filtering
+def filter_hits_parallel(df, pool, workers, **filter_kwargs):
+    shard_ids = pd.util.hash_pandas_object(df["qseqid"], index=False) % workers
+    shards = [df[shard_ids == i] for i in range(workers)]
+    filtered = pool.map(partial(filter_hits, verbose=False, **filter_kwargs), shards)
+    return pd.concat(filtered).sort_index(kind="stable")
+
+
+# Define class to write filtered hits, either at once or chunk by chunk, to a .csv
+# file or, based on the file extension, to a .parquet or .arrow file with
+# dictionary-encoded ranks
+class HitWriter:
+    def __init__(self, out, ranks):
+        self.out = out
+        self.ranks = ranks
+        self.taxa = {rank: pd.Index([], dtype=object) for rank in ranks}
+        self.schema = None
+        self.writer = None
+        self.first_chunk = True
+
+    def write(self, df):
+        if not self.out.endswith(parquet_extensions + arrow_extensions):
+            df.to_csv(
+                self.out,
+                index=False,
+                mode="w" if self.first_chunk else "a",
+                header=self.first_chunk,
+            )
+            self.first_chunk = False
+            return
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # Encode ranks with one dictionary per rank that is only ever appended to,
+        # as .arrow files only allow dictionaries to be extended between chunks
+        for rank in self.ranks:
+            new_taxa = pd.Index(df[rank].unique(), dtype=object)
+            self.taxa[rank] = self.taxa[rank].append(
+                new_taxa[~new_taxa.isin(self.taxa[rank])]
+            )
+            df = df.assign(**{rank: pd.Categorical(df[rank], self.taxa[rank])})
+
+        if self.writer is None:
+            # Fix the schema with the first chunk, so that the dictionaries of all
+            # chunks share one index type
+            self.schema = pa.Schema.from_pandas(df, preserve_index=False)
+            for rank in self.ranks:
+                self.schema = self.schema.set(
+                    self.schema.get_field_index(rank),
+                    pa.field(rank, pa.dictionary(pa.int32(), pa.string())),
+                )
+            if self.out.endswith(parquet_extensions):
+                self.writer = pq.ParquetWriter(self.out, self.schema)
+            else:
+                self.writer = pa.ipc.new_file(
+                    self.out,
+                    self.schema,
+                    options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True),
+                )
+        self.writer.write_table(
+            pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        )
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
 
 
 # Define a custom argument type for a list of strings
@@ -47,7 +339,11 @@ parser = argparse.ArgumentParser(
     description="Filter BLAST output.", formatter_class=SmartFormatter
 )
 parser.add_argument(
-    "inputfile", help="Input file in BLAST standard output format and .csv format."
+    "inputfile",
+    help=(
+        "Input file in BLAST standard output format and .csv format, or in "
+        ".parquet/.arrow format (requires pyarrow)."
+    ),
 )
 parser.add_argument(
     "filter_mode",
@@ -89,11 +385,11 @@ parser.add_argument(
 parser.add_argument(
     "-b",
     "--bitscore",
-    default=150,
+    default=155,
     type=int,
     help=(
         "Bitscore threshold to perform bitscore filtering on when choosing "
-        'filter_mode option "strict" (default=150).'
+        'filter_mode option "strict" (default=155).'
     ),
 )
 parser.add_argument(
@@ -135,91 +431,143 @@ parser.add_argument(
     ),
 )
 parser.add_argument(
-    "-o", "--out", default="blast_filtered.txt", type=str, help="Name of output file."
+    "-s",
+    "--stream",
+    action="store_true",
+    help=(
+        "Read in and filter the input file in chunks of complete qseqid groups "
+        "(see -n) instead of loading it into memory at once, for input files "
+        "larger than memory. Requires hits to be grouped by qseqid, as in BLAST "
+        "output. The output is identical to the default mode."
+    ),
+)
+parser.add_argument(
+    "--sort",
+    action="store_true",
+    help=(
+        "Sort the input file by qseqid and bitscore first, on disk in bounded "
+        "memory (see -n), for .csv input files that are larger than memory and "
+        "not grouped by qseqid. Implies --stream, sequences are written in "
+        "sorted order."
+    ),
+)
+parser.add_argument(
+    "-n",
+    "--chunksize",
+    default=1000000,
+    type=int,
+    help=(
+        "Number of lines read in per chunk with option --stream, and sorted in "
+        "memory at once with option --sort (default=1000000)."
+    ),
+)
+parser.add_argument(
+    "-w",
+    "--workers",
+    default=1,
+    type=int,
+    help=(
+        "Number of worker processes to filter hits with. Hits are split up by "
+        "qseqid across workers and merged back into input order (default=1)."
+    ),
+)
+parser.add_argument(
+    "-o",
+    "--out",
+    default="blast_filtered.txt",
+    type=str,
+    help=(
+        "Name of output file. Output is written in .csv format, or in "
+        ".parquet/.arrow format if the name ends with .parquet/.arrow (requires "
+        "pyarrow)."
+    ),
 )
-args = parser.parse_args()
-
-# Set arguments
-file = args.inputfile
-filter_mode = args.filter_mode
-percentage = args.percentage / 100
-length = args.length
-bitscore_threshold = args.bitscore
-cutoff = args.cutoff
-keep_pident = args.keep_pident
-out = args.out
-ranks = args.ranks
-
-# Define which columns to load in
-req_cols = ["qseqid", "pident", "length", "bitscore"] + ranks
-
-# Only read in columns we need
-time_print("Reading in file...")
-df = pd.read_csv(
-    file,
-    index_col=False,
-    usecols=req_cols,
-    dtype={"qseqid": str, "bitscore": float, "pident": float},
-).fillna("NA")
-
-# Drop rows containing "Unknown" = taxid could not be translated
-df = df[~df[ranks].apply(lambda row: row.str.contains("Unknown")).any(axis=1)]
-
-if filter_mode == "soft":
-    time_print(
-        "Grouping qseqids and filtering hits based on the highest bitscore of each qseqid..."
-    )
-    idx = df.groupby(["qseqid"])["bitscore"].transform(max) == df["bitscore"]
-    df = df[idx]
 
-elif filter_mode == "strict":
-    time_print("Filtering hits based on bitscore and length...")
-    df.loc[(df["length"] < 100) & (df["bitscore"] < 155), ranks] = "NA"
+if __name__ == "__main__":
+    args = parser.parse_args()
 
-    time_print(
-        "Grouping qseqids and filtering hits based on bitscore cutoff for each qseqid..."
-    )
-    idx = (
-        df.groupby(["qseqid"])["bitscore"].transform(bitscore_cutoff) == df["bitscore"]
-    )
-    df = df[idx]
+    # Set arguments
+    file = args.inputfile
+    filter_mode = args.filter_mode
+    percentage = args.percentage / 100
+    length = args.length
+    bitscore_threshold = args.bitscore
+    cutoff = args.cutoff
+    keep_pident = args.keep_pident
+    out = args.out
+    ranks = args.ranks
+
+    # Define which columns to load in
+    req_cols = ["qseqid", "pident", "length", "bitscore"] + ranks
+
+    filter_kwargs = {
+        "filter_mode": filter_mode,
+        "ranks": ranks,
+        "cutoff": cutoff,
+        "percentage": percentage,
+        "length": length,
+        "bitscore_threshold": bitscore_threshold,
+        "keep_pident": keep_pident,
+    }
+
+    # Define how to filter, either in this process or sharded across workers
+    if args.workers > 1:
+        pool = multiprocessing.Pool(args.workers)
 
-    time_print("Applying similarity cutoff...")
-    df.loc[df["pident"] < cutoff[0], "species"] = "NA"
-    df.loc[df["pident"] < cutoff[1], "genus"] = "NA"
-    df.loc[df["pident"] < cutoff[2], "family"] = "NA"
-    df.loc[df["pident"] < cutoff[3], ["order", "suborder", "infraorder"]] = "NA"
-    df.loc[df["pident"] < cutoff[4], ["class", "subclass"]] = "NA"
-    df.loc[df["pident"] < cutoff[5], ["phylum", "subphylum"]] = "NA"
+        def run_filter(df, verbose=True):
+            if verbose:
+                time_print(f"Filtering hits with {args.workers} workers...")
+            return filter_hits_parallel(df, pool, args.workers, **filter_kwargs)
 
-# Keep only relevant columns and put species to last column
-df_tax = df[["qseqid"] + ranks]
+    else:
 
-## Make a df mask: group dfs, check if ranks have more than one taxon, and if yes, True, else False
-time_print("Performing LCA filter...")
-lca_mask = df_tax.groupby(["qseqid"]).transform(lambda x: len(set(x)) != 1)
+        def run_filter(df, verbose=True):
+            return filter_hits(df, verbose=verbose, **filter_kwargs)
 
-## Replace ranks in df with "NA" based on mask
-df_tax = df_tax.mask(lca_mask, "NA")
+    # Sort hits by qseqid and bitscore into a temporary file next to the output
+    if args.sort:
+        if file.endswith(parquet_extensions + arrow_extensions):
+            parser.error("--sort requires a .csv input file")
+        from hit_sort import sort_hits
 
-# Add qseqid info
-df_tax["qseqid"] = df["qseqid"]
+        time_print("Sorting file...")
+        sorted_file = out + ".sorted.tmp"
+        sort_hits(
+            file,
+            sorted_file,
+            "qseqid",
+            "bitscore",
+            header=True,
+            sep=",",
+            max_lines=args.chunksize,
+        )
+        file = sorted_file
+        args.stream = True
 
-if keep_pident == "yes":
-    # Add pident info
-    df_tax["pident"] = df["pident"]
+    writer = HitWriter(out, ranks)
+    if args.stream:
+        # Filter chunk by chunk and append each chunk to the output file
+        time_print("Reading in and filtering file in chunks...")
+        n_hits = 0
+        for df in read_hit_groups(file, req_cols, ranks, args.chunksize):
+            n_hits += len(df)
+            writer.write(run_filter(df, verbose=False))
+            time_print(f"Processed {n_hits} hits...")
+    else:
+        # Only read in columns we need
+        time_print("Reading in file...")
+        df, _ = encode_ranks(read_hits(file, req_cols, ranks), ranks)
+        df = df.fillna("NA")
 
-## Drop duplicate rows == aggregate taxonomic info
-df = df_tax.drop_duplicates()
+        # Filter and save df
+        writer.write(run_filter(df))
+    writer.close()
 
-if keep_pident == "yes":
-    # Per OTU and identical taxon match, keep the max pident
-    idx_pident = df.groupby(["qseqid"] + ranks)["pident"].transform(max) == df["pident"]
-    df = df[idx_pident]
-    df = df.rename(columns={"pident": "percentage_similarity"})
+    if args.sort:
+        os.remove(sorted_file)
 
-# Change column name and save df
-df = df.rename(columns={"qseqid": "sequence_name"})
-df.to_csv(out, index=False)
+    if args.workers > 1:
+        pool.close()
+        pool.join()
 
-time_print("Filtering done.")
+    time_print("Filtering done.")
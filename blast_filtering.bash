@@ -8,15 +8,21 @@
 # Script to BLAST .fasta files using blastn, add taxonomy to the hits,
 # and filter the hits so that each sequence gets assigned to one taxonomy
 
-# Need to have scripts assign_taxonomy_to_NCBI_staxids.sh and LookupTaxonDetails3.py
-# in your PATH, and ete3 and justblast installed (https://pypi.org/project/justblast/)
+# Each stage keeps a checkpoint of its output in
+# blast_filtering_results/checkpoints/, so if the script is run again in the same
+# directory (e.g. after a crash), stages whose input and parameters haven't
+# changed are skipped. Delete that folder to rerun everything
+
+# Need to have scripts assign_taxonomy_to_NCBI_staxids.sh, LookupTaxonDetails3.py,
+# taxonomy_filter.py, blast_filter.py, hit_sort.py and taxonomy_index.py in your
+# PATH, and ete3 and justblast installed (https://pypi.org/project/justblast/)
 
 # In order for "assign_taxonomy_to_NCBI_staxids.sh" to work - you MUST have
 # .etetoolkit/taxa.sqlite in your HOME directory - check the ete3 toolkit
 # to see how that's set up (http://etetoolkit.org/)
 
 cmd="$0 $@" # Make variable containing full used command to print command in logfile
-usage="$(basename "$0") -i <input.fa> -f <fasta|blast> -t <soft|strict> -e <PATH/TO/.etetoolkit/taxa.sqlite> [-d <DB> -b <bitscore> -p <percentage> -c <n n n n n n> -T <threads>]
+usage="$(basename "$0") -i <input.fa> -f <fasta|blast> -t <soft|strict> <-e <PATH/TO/.etetoolkit/taxa.sqlite>|-x <PATH/TO/taxonomy_index>> [-d <DB> -b <bitscore> -p <percentage> -c <n n n n n n> -T <threads>]
 
 Usage:
   -i       Input file.
@@ -46,6 +52,8 @@ Usage:
               all taxonomic ranks that are identical in the remaining hits of
               each sequence.
   -e       Path to .etetoolkit/taxa.sqlite (usually in home directory)
+  -x       Path to taxonomy index made with taxonomy_index.py, used instead of
+           ete3 and .etetoolkit/taxa.sqlite (replaces -e)
   -d       Database to use for blast.
   -b       Bitscore threshold to perform bitscore filtering on (-t) strict
            (default=155).
@@ -69,11 +77,12 @@ cutoff='99 97 95 90 85 80'
 threads='16'
 
 # Set specified options
-while getopts ':i:f:e:d:t:b:p:c:T:h' opt; do
+while getopts ':i:f:e:x:d:t:b:p:c:T:h' opt; do
  	case "${opt}" in
 		i) input="${OPTARG}" ;;
     f) format="${OPTARG}" ;;
     e) etetoolkit="${OPTARG}" ;;
+    x) taxonomy_index="${OPTARG}" ;;
     d) db="${OPTARG}" ;;
 		t) filtering="${OPTARG}" ;;
 		b) bitscore="${OPTARG}" ;;
@@ -93,8 +102,8 @@ done
 shift $((OPTIND - 1))
 
 # Check if required options are set
-if [[ -z "$input" || -z "$format" || -z "$filtering" || -z "$etetoolkit" ]]; then
-   echo -e "-i, -f, -e, and -t must be set\n"
+if [[ -z "$input" || -z "$format" || -z "$filtering" || (-z "$etetoolkit" && -z "$taxonomy_index") ]]; then
+   echo -e "-i, -f, -e or -x, and -t must be set\n"
    echo -e "$usage\n\n"
    echo -e "Exiting script\n"
    exit
@@ -123,6 +132,11 @@ fi
 
 ##################### Write time, options etc. to output ######################
 
+# Make pipelines fail if any of their commands fails, so that a failing stage
+# isn't hidden by tee (or any other command it is piped into) and doesn't get a
+# checkpoint
+set -o pipefail
+
 # Make open bracket to later tell script to write everything that follows into a logfile
 (
 
@@ -144,199 +158,145 @@ echo "Cutoff (-c) is $cutoff"
 echo "$threads threads were used"
 echo -e "Script started with full command: $cmd\n"
 
-mkdir blast_filtering_results/
-
-
-if [[ $format == 'fasta' ]] ; then
-  echo -e "\n======== RUNNING JUSTBLAST AGAINST DB ========\n"
+mkdir -p blast_filtering_results/checkpoints/
+checkpoint_dir=blast_filtering_results/checkpoints
+
+# Function to run a stage only if there's no checkpoint for it yet. Checkpoints
+# are content-addressed: the output of a stage is kept in $checkpoint_dir under a
+# key made from the stage name, the sha256sum of the stage's input and the
+# stage's parameters, so that a rerun (e.g. after a crash) skips all stages whose
+# input and parameters haven't changed. Outputs are hard-linked to checkpoints,
+# so they don't take up extra space
+# Usage: run_stage <stage> <input> <output> <parameters> <command...>
+run_stage() {
+  local stage=$1 input=$2 output=$3 parameters=$4
+  shift 4
+  local key=$(echo "$stage $(sha256sum < "$input" | cut -d ' ' -f 1) $parameters" \
+  | sha256sum | cut -c 1-32)
+  local checkpoint=$checkpoint_dir/${stage}_$key
+  if [[ -f $checkpoint ]]; then
+    echo "Input and parameters of stage $stage unchanged, using checkpoint $checkpoint"
+    ln -f "$checkpoint" "$output" 2>/dev/null || cp -f "$checkpoint" "$output"
+    return
+  fi
+  # Remove the output of an earlier (failed) run, it might be linked to a checkpoint
+  rm -f "$output"
+  if ! "$@" ; then
+    echo "Stage $stage failed, exiting script"
+    exit 1
+  fi
+  ln -f "$output" "$checkpoint" 2>/dev/null || cp -f "$output" "$checkpoint"
+}
+
+blast_stage() {
   blastn -query $input -db $db -out blast_filtering_results/blast_output.txt \
   -outfmt "6 qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore staxids" \
   -evalue 1e-05 -num_threads $threads
+}
+
+if [[ $format == 'fasta' ]] ; then
+  echo -e "\n======== RUNNING JUSTBLAST AGAINST DB ========\n"
+  run_stage blast $input blast_filtering_results/blast_output.txt "$db" blast_stage
   assign_taxonomy_input="blast_filtering_results/blast_output.txt"
   echo -e "\n======== JUSTBLAST DONE ========\n"
 else
   assign_taxonomy_input=$input
 fi
 
-if [[ $filtering == 'soft' ]] ; then
-  # Keeping only the best hit of each sequence:
-  echo -e "\n======== ASSIGNING TAXONOMY ========\n"
+# Prefix of all files made from the input in blast_filtering_results/
+prefix=blast_filtering_results/$(basename ${assign_taxonomy_input%.txt})
+
+taxonomy_stage() {
   # Using a subscript:
   assign_taxonomy_to_NCBI_staxids.sh -b $assign_taxonomy_input -c 13 \
-  -e $etetoolkit
-  mv ${assign_taxonomy_input%.txt}_with_taxonomy.txt blast_filtering_results/
-  sed -i '1d' blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy.txt
+  ${etetoolkit:+-e $etetoolkit} ${taxonomy_index:+-x $taxonomy_index} || return
+  # The subscript writes its output into the current directory
+  mv $(basename ${prefix})_with_taxonomy.txt ${prefix}_with_taxonomy.txt \
+  && sed -i '1d' ${prefix}_with_taxonomy.txt
+}
 
-  echo -e "\n======== KEEPING ONLY BEST HIT PER SEQUENCE ========\n"
+echo -e "\n======== ASSIGNING TAXONOMY ========\n"
+run_stage taxonomy $assign_taxonomy_input ${prefix}_with_taxonomy.txt \
+"${etetoolkit}${taxonomy_index}" taxonomy_stage
+
+if [[ $filtering == 'soft' ]] ; then
+  # Keeping only the best hit of each sequence:
+  echo -e "\n======== KEEPING ONLY BEST HIT PER SEQUENCE AND PERFORMING LCA ========\n"
   # Just keep hits with the same best bitscore for each sequence, in case multiple
-  # hits have the same bitscore:
-  touch blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_filter.txt
-  sort -u -k1,1 blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy.txt \
-  | cut -f 1 | while read hit; do
-    best_bitscore=$(grep "$(printf "^$hit\t")" blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy.txt \
-    | sort -k1,1 -k12,12nr | sort -u -k1,1 | cut -f 12)
-    echo "Processing sequence $hit with bitscore $best_bitscore"
-    grep $hit blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy.txt \
-    | awk -v x=$best_bitscore '($12 >= x)' \
-    >> blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_filter.txt
-  done
-
-  # Now we run an LCA approach, but it technically only runs if a sequence has
-  # several hits with the same best bit score:
-  touch blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_filter_and_LCA_noheader.txt
-  sort -u -k1,1 blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_filter.txt \
-  | cut -f 1 | while read hit ; do
-    taxonomy=''
-    for i in {15..27} # over all taxonomic ranks
-    do
-      rank_tax=$(grep $hit blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_filter.txt \
-      | cut -f $i | cut -f 1-2 -d " " | uniq) # Extract taxonomy and cut down to first two words (essentially just relevant for rank "species", if more than two, e.g. subspecies info, we just want genus and species)
-      if [[ $(echo "${rank_tax}" | wc -l) == 1 ]] ; then # If all taxonomy hits are the same
-        if [[ ${i} == 15 ]]; then # if we look at species
-          if [[ $(echo "${rank_tax}" | wc -w) == 1 ]]; then
-            taxonomy=$(echo "${taxonomy}---NA")
-          elif [[ "${rank_tax:0:1}" =~ [A-Z] ]]; then # if first letter is capitalized (indicates format "Genus species")
-            if [[ "${$(echo $rank_tax | cut -f 2 -d ' '):0:1}" =~ [a-] ]]; then
-              taxonomy=$(echo "${taxonomy}---${rank_tax}") # if first letter is non-capitalized (indicates format "Genus species")
-            else
-              taxonomy=$(echo "${taxonomy}---NA")
-            fi
-          else # if first letter not capitalized (indicates stuff like "uncultured bacterium" etc.)
-            taxonomy=$(echo "${taxonomy}---NA")
-          fi
-        else # if not species rank and all taxonomy hits are the same
-          taxonomy=$(echo "${taxonomy}---${rank_tax}")
-        fi
-      else # if taxonomy hits are not all the same
-        taxonomy=$(echo "${taxonomy}---NA")
-      fi
-    done
-    echo "${hit}${taxonomy}" | sed 's/---/\t/g' \
-    >> blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_filter_and_LCA_noheader.txt
-  done
-
-  # Adding header and rearranging columns:
-  awk 'BEGIN {FS="\t"; OFS="\t"} {print $1, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $2}' \
-  blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_filter_and_LCA_noheader.txt \
-  > tmp
-  echo -e "sequence_name\tsuperkingdom\tkingdom\tphylum\tsubphylum\tclass\tsubclass\torder\tsuborder\tinfraorder\tfamily\tgenus\tspecies" \
-  > blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_best_hit.txt \
-  && cat tmp \
-  >> blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_best_hit.txt
-  rm tmp
+  # hits have the same bitscore, and run an LCA approach on them, in a single
+  # pass over all sequences using a subscript:
+  run_stage soft_filter ${prefix}_with_taxonomy.txt \
+  ${prefix}_with_taxonomy_and_best_hit.txt "" \
+  taxonomy_filter.py soft -i ${prefix}_with_taxonomy.txt \
+  -o ${prefix}_with_taxonomy_and_best_hit.txt
 
   # Sort files:
-  mkdir blast_filtering_results/intermediate_files/
-  mv blast_filtering_results/${assign_taxonomy_input%.txt}* blast_filtering_results/intermediate_files/
-  mv blast_filtering_results/intermediate_files/${assign_taxonomy_input%.txt}_with_taxonomy_and_best_hit.txt \
+  mkdir -p blast_filtering_results/intermediate_files/
+  # Files of an earlier run might be linked to the same checkpoints
+  rm -f blast_filtering_results/intermediate_files/$(basename ${prefix})*
+  mv ${prefix}* blast_filtering_results/intermediate_files/
+  mv blast_filtering_results/intermediate_files/$(basename ${prefix})_with_taxonomy_and_best_hit.txt \
   blast_filtering_results/
 fi
 
 if [[ $filtering == 'strict' ]] ; then
-  # Filtering reads:
-  echo -e "\n======== ASSIGNING TAXONOMY ========\n"
-  # Using a subscript:
-  assign_taxonomy_to_NCBI_staxids.sh -b $assign_taxonomy_input -c 13 \
-  -e $etetoolkit
-  mv ${assign_taxonomy_input%.txt}_with_taxonomy.txt blast_filtering_results/
-  sed '1d' blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy.txt \
-  > blast_filtering_results/${assign_taxonomy_input%.txt}_bitscore_filtered_with_taxonomy_noheader.txt \
-  && mv blast_filtering_results/${assign_taxonomy_input%.txt}_bitscore_filtered_with_taxonomy_noheader.txt \
-  blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy.txt
+  bitscore_stage() {
+    # Remove all hits that are below alignment length 100 (based on BASTA) and set
+    # bitscore (default 155 based on CREST), and just keep hits within first set %
+    # of best bitscore for each sequence, in a single pass over the hits using a
+    # subscript. Hits are sorted by sequence and bitscore first, on disk in
+    # bounded memory:
+    taxonomy_filter.py bitscore --sort -b $bitscore -p $percentage \
+    -i ${prefix}_with_taxonomy.txt \
+    -o ${prefix}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter.txt
+  }
 
   echo -e "\n======== PERFORMING BITSCORE FILTER ========\n"
-  # Remove all hits that are below alignment length 100 (based on BASTA) and set
-  # bitscore (default 155 based on CREST):
-  awk -v x=$bitscore '($4 >= 100 && $12 >= x)' \
-  blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy.txt \
-  > blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold.txt
-
-  # Just keep hits within first set % of best bitscore for each sequence
-  touch blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter.txt
-  sort -u -k1,1 blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold.txt \
-  | cut -f 1 | while read hit; do
-    best_bitscore=$(grep "$(printf "^$hit\t")" blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold.txt \
-    | sort -k1,1 -k12,12nr | sort -u -k1,1 | cut -f 12)
-    echo "Processing sequence $hit with bitscore $best_bitscore"
-    bitscore_threshold=$(awk "BEGIN {print $best_bitscore - $best_bitscore * $percentage}")
-    grep $hit blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold.txt \
-    | awk -v x=$bitscore_threshold '($12 >= x)' \
-    >> blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter.txt
-  done
-
+  run_stage bitscore_filter ${prefix}_with_taxonomy.txt \
+  ${prefix}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter.txt \
+  "$bitscore $percentage" bitscore_stage
+
+  cutoff_stage() {
+    # Setting the ranks of hits to "NA" if the hits' pident is below the cutoff of
+    # the rank, all ranks at once in a single pass over the hits using a
+    # subscript, which keeps the order of hits:
+    taxonomy_filter.py cutoff -c $cutoff \
+    -i ${prefix}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter.txt \
+    -o ${prefix}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff.txt
+  }
 
   echo -e "\n======== PERFORMING SIMILARITY CUTOFF ========\n"
-  # Setting certain columns to "NA" if they're below set threshold
-  set -- $cutoff
-  awk -v c1=$1 '($3 >= c1)' blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter.txt \
-  > blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff.txt
-  awk -v c1=$1 -v c2=$2 '(($3 < c1) && ($3 >= c2))' blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter.txt \
-  | awk '{ FS="\t"; $0=$0; OFS="\t"; $16="NA"; print}'\
-  >> blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff.txt
-  awk -v c2=$2 -v c3=$3 '(($3 < c2) && ($3 >= c3))' blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter.txt \
-  | awk '{ FS="\t"; $0=$0; OFS="\t"; $16="NA"; $27="NA"; print}'\
-  >> blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff.txt
-  awk -v c3=$3 -v c4=$4 '(($3 < c3) && ($3 >= c4))' blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter.txt \
-  | awk '{ FS="\t"; $0=$0; OFS="\t"; $16="NA"; $27="NA"; $26="NA"; $25="NA"; $24="NA"; print}' \
-  >> blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff.txt
-  awk -v c4=$4 -v c5=$5 '(($3 < c4) && ($3 >= c5))' blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter.txt \
-  | awk '{ FS="\t"; $0=$0; OFS="\t"; $16="NA"; $27="NA"; $26="NA"; $25="NA"; $24="NA"; $23="NA"; $22="NA"; print}' \
-  >> blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff.txt
-  awk -v c5=$5 -v c6=$6 '(($3 < c5) && ($3 >= c6))' blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter.txt \
-  | awk '{ FS="\t"; $0=$0; OFS="\t"; $16="NA"; $27="NA"; $26="NA"; $25="NA"; $24="NA"; $23="NA"; $22="NA"; $21="NA"; $20="NA"; print}' \
-  >> blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff.txt
-  awk -v c6=$6 '($3 < c6)' blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter.txt \
-  | awk '{ FS="\t"; $0=$0; OFS="\t"; $16="NA"; $27="NA"; $26="NA"; $25="NA"; $24="NA"; $23="NA"; $22="NA"; $21="NA"; $20="NA"; $19="NA"; $18="NA"; print}' \
-  >> blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff.txt
+  run_stage pident_cutoff ${prefix}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter.txt \
+  ${prefix}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff.txt \
+  "$cutoff" cutoff_stage
+
+  lca_stage() {
+    # Only keeping the taxonomy to the LCA, other ranks are set to "NA", in a
+    # single pass over the hits, which are grouped by sequence, using a
+    # subscript. Species are cut down to their first two words and only kept if
+    # the first letter is capitalized (indicates format "Genus species"):
+    taxonomy_filter.py lca \
+    -i ${prefix}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff.txt \
+    -o ${prefix}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff_and_LCA.txt
+  }
 
   echo -e "\n======== PERFORMING LCA APPROACH ========\n"
-  # Only keeping the taxonomy to the LCA, other ranks are set to "NA"
-  touch blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff_and_LCA_noheader.txt
-  sort -u -k1,1 blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff.txt \
-  | cut -f 1 | while read hit ; do
-    taxonomy=''
-    for i in {15..27}
-    do
-      rank_tax=$(grep $hit blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff.txt \
-      | cut -f $i | cut -f 1-2 -d " " | uniq) # Extract taxonomy and cut down to first two words (essentially just relevant for rank "species", if more than two, e.g. subspecies info, we just want genus and species)
-      if [[ $(echo "${rank_tax}" | wc -l) == 1 ]] ; then # If all taxonomy hits are the same
-        if [[ ${i} == 15 ]]; then # if we look at species
-          if [[ "${rank_tax:0:1}" =~ [A-Z] ]]; then # if first letter is capitalized (indicates format "Genus species")
-            taxonomy=$(echo "${taxonomy}---${rank_tax}")
-          else # if first letter not capitalized (indicates stuff like "uncultured bacterium" etc.)
-            taxonomy=$(echo "${taxonomy}---NA")
-          fi
-        else # if not species rank and all taxonomy hits are the same
-          taxonomy=$(echo "${taxonomy}---${rank_tax}")
-        fi
-      else # if taxonomy hits are not all the same
-        taxonomy=$(echo "${taxonomy}---NA")
-      fi
-    done
-    echo "${hit}${taxonomy}" | sed 's/---/\t/g' \
-    >> blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff_and_LCA_noheader.txt
-  done
-
-  # Adding header and rearranging columns:
-  awk 'BEGIN {FS="\t"; OFS="\t"} {print $1, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $2}' \
-  blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff_and_LCA_noheader.txt \
-  > tmp
-  echo -e "sequence_name\tsuperkingdom\tkingdom\tphylum\tsubphylum\tclass\tsubclass\torder\tsuborder\tinfraorder\tfamily\tgenus\tspecies" \
-  > blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff_and_LCA.txt \
-  && cat tmp \
-  >> blast_filtering_results/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff_and_LCA.txt
-  rm tmp
+  run_stage lca ${prefix}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff.txt \
+  ${prefix}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff_and_LCA.txt \
+  "" lca_stage
 
   # Sort files:
-  mkdir blast_filtering_results/intermediate_files/
-  mv blast_filtering_results/${assign_taxonomy_input%.txt}* blast_filtering_results/intermediate_files/
-  mv blast_filtering_results/intermediate_files/${assign_taxonomy_input%.txt}_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff_and_LCA.txt \
+  mkdir -p blast_filtering_results/intermediate_files/
+  # Files of an earlier run might be linked to the same checkpoints
+  rm -f blast_filtering_results/intermediate_files/$(basename ${prefix})*
+  mv ${prefix}* blast_filtering_results/intermediate_files/
+  mv blast_filtering_results/intermediate_files/$(basename ${prefix})_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff_and_LCA.txt \
   blast_filtering_results/
 fi
 
 # If blast was run, remove indexed files
 if [[ $format == 'fasta' ]] ; then
-  rm $input.fai
+  rm -f $input.fai
 fi
 
 # Display runtime
@@ -345,5 +305,8 @@ echo "SCRIPT DONE AFTER $((($(date +%s)-$start)/3600))h $(((($(date +%s)-$start)
 
 # Create log
 ) 2>&1 | tee blast_filtering_log.txt
+# Keep the exit status of the script, not of tee
+status=${PIPESTATUS[0]}
 
 mv blast_filtering_log.txt blast_filtering_results/
+exit $status
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+
+"""
+A script to BLAST .fasta files using blastn, add taxonomy to the hits, and filter
+the hits so that each sequence gets assigned to one taxonomy, with the same
+options and output as blast_filtering.bash.
+
+Everything runs in one process: BLAST rows are streamed from blastn, a file or
+stdin in chunks of complete sequences, taxonomy is assigned with a taxonomy index
+(taxonomy_index.py) in memory, and the chunks are filtered (taxonomy_filter.py)
+right away, so that no intermediate files are written.
+
+With -s, the query .fasta is split into shards of about the same number of bases
+and one blastn per shard runs concurrently (with -T divided among them), each
+shard's hits being assigned taxonomy and filtered while the other shards are
+still running.
+
+Needs taxonomy_index.py and taxonomy_filter.py in the same directory, and blastn
+in your PATH for -f fasta.
+
+By Chris Hempel (christopher.hempel@kaust.edu.sa) on 18 Oct 2026
+"""
+
+import os
+import sys
+import csv
+import time
+import heapq
+import argparse
+import threading
+import subprocess
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from taxonomy_index import (
+    TaxonomyIndex,
+    lookup_taxonomy,
+    read_sqlite_taxonomy,
+    taxonomic_levels,
+    time_print,
+)
+from taxonomy_filter import (
+    blast_columns,
+    filter_taxonomy,
+    group_chunks,
+    write_filtered,
+)
+
+# Define the BLAST output format that is expected as input
+blast_outfmt = (
+    "6 qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue "
+    "bitscore staxids"
+)
+
+# Define the suffixes of the output file per filter mode, same as in
+# blast_filtering.bash
+output_suffixes = {
+    "soft": "_with_taxonomy_and_best_hit.txt",
+    "strict": (
+        "_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident_cutoff"
+        "_and_LCA.txt"
+    ),
+}
+
+
+# Define function to read in BLAST rows from an open file in chunks
+def read_blast_chunks(blast, chunksize):
+    return pd.read_csv(
+        blast,
+        sep="\t",
+        header=None,
+        names=blast_columns,
+        dtype=str,
+        keep_default_na=False,
+        quoting=csv.QUOTE_NONE,
+        chunksize=chunksize,
+    )
+
+
+# Define function to assign taxonomy to a chunk of hits. The taxonomy of each
+# distinct taxid is only looked up once and kept for the following chunks, and
+# taxonomy columns are made per distinct staxids value and then spread to all hits
+def assign_taxonomy(df, index, taxonomies):
+    codes, staxids = pd.factorize(df["staxid"])
+    taxids = [staxid.split(";")[0] for staxid in staxids]
+    new_taxids = set(taxids).difference(taxonomies)
+    if new_taxids:
+        taxonomies.update(lookup_taxonomy(index, list(new_taxids)))
+    taxonomy = pd.DataFrame(
+        [taxonomies[taxid] for taxid in taxids],
+        columns=["lowest_rank", "lowest_hit"] + taxonomic_levels,
+    )
+    taxonomy = taxonomy.take(codes).set_axis(df.index)
+    return pd.concat([df, taxonomy], axis=1).astype(
+        {"pident": float, "length": float, "bitscore": float}
+    )
+
+
+# Define function to run the pipeline on an open file of BLAST rows
+def run_pipeline(blast, index, filter_mode, bitscore, percentage, cutoffs, chunksize):
+    taxonomies = {}
+    n_hits = 0
+    filtered = []
+    annotated_chunks = (
+        assign_taxonomy(chunk, index, taxonomies)
+        for chunk in read_blast_chunks(blast, chunksize)
+    )
+    for df in group_chunks(annotated_chunks):
+        n_hits += len(df)
+        filtered.append(filter_taxonomy(df, filter_mode, bitscore, percentage, cutoffs))
+    return filtered, n_hits
+
+
+# Define function to split the records of a .fasta file into shards with about
+# the same number of bases: records are assigned from longest to shortest to the
+# shard with the fewest bases so far, and keep their order within shards
+def shard_fasta(fasta, shards):
+    records, lengths = [], []
+    with open(fasta) as fasta_file:
+        for line in fasta_file:
+            if line.startswith(">"):
+                records.append([line])
+                lengths.append(0)
+            elif records:
+                records[-1].append(line)
+                lengths[-1] += len(line.strip())
+    shard_bases = [(0, shard) for shard in range(shards)]
+    shard_records = [[] for _ in range(shards)]
+    for i in sorted(range(len(records)), key=lambda i: -lengths[i]):
+        bases, shard = heapq.heappop(shard_bases)
+        shard_records[shard].append(i)
+        heapq.heappush(shard_bases, (bases + lengths[i], shard))
+    return [
+        "".join("".join(records[i]) for i in sorted(indices))
+        for indices in shard_records
+        if indices
+    ]
+
+
+# Define function to start blastn on a query given as text, which is written to
+# blastn's stdin by a separate thread, so that blastn's output can be read at the
+# same time
+def start_blastn(query, db, threads):
+    blastn = subprocess.Popen(
+        [
+            "blastn",
+            "-query",
+            "-",
+            "-db",
+            db,
+            "-outfmt",
+            blast_outfmt,
+            "-evalue",
+            "1e-05",
+            "-num_threads",
+            str(threads),
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+
+    def write_query():
+        try:
+            blastn.stdin.write(query)
+            blastn.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    threading.Thread(target=write_query, daemon=True).start()
+    return blastn
+
+
+# Define function to run the pipeline on the hits of a shard's blastn
+def blast_shard(blastn, *pipeline_args):
+    filtered, n_hits = run_pipeline(blastn.stdout, *pipeline_args)
+    blastn.stdout.close()
+    if blastn.wait():
+        raise RuntimeError(f"blastn failed with exit code {blastn.returncode}")
+    return filtered, n_hits
+
+
+# Define function to stop the blastn of all shards, e.g. when one shard failed,
+# so that the pipelines of the other shards end with their blastn's output
+def stop_blastns(blastns):
+    for blastn in blastns:
+        blastn.kill()
+
+
+# Define arguments
+parser = argparse.ArgumentParser(
+    description=(
+        "BLAST .fasta files using blastn, add taxonomy to the hits, and filter the "
+        "hits so that each sequence gets assigned to one taxonomy."
+    )
+)
+parser.add_argument(
+    "-i", "--input", required=True, help="Input file, '-' to read from stdin."
+)
+parser.add_argument(
+    "-f",
+    "--format",
+    required=True,
+    choices=["fasta", "blast"],
+    help=(
+        "Format of input file. fasta: blastn is performed first, then results are "
+        "filtered based on option -t, requires option -d. blast: input is already "
+        "blast output in the outformat '" + blast_outfmt + "' and is just filtered "
+        "based on option -t."
+    ),
+)
+parser.add_argument(
+    "-t",
+    "--filtering",
+    required=True,
+    choices=["soft", "strict"],
+    help=(
+        "Type of filtering. soft: keeps the best hit (highest bitscore) for each "
+        "sequence, if multiple hits have the same highest bitscore, an LCA approach "
+        "is applied. strict: bitscore filtering (-b, -p), similarity cutoff (-c) "
+        "and LCA approach."
+    ),
+)
+taxonomy_source = parser.add_mutually_exclusive_group(required=True)
+taxonomy_source.add_argument(
+    "-e", "--etetoolkit", help="Path to .etetoolkit/taxa.sqlite."
+)
+taxonomy_source.add_argument(
+    "-x", "--index", help="Path to taxonomy index made with taxonomy_index.py."
+)
+parser.add_argument("-d", "--db", help="Database to use for blast.")
+parser.add_argument(
+    "-b",
+    "--bitscore",
+    default=155,
+    type=float,
+    help="Bitscore threshold to perform bitscore filtering on strict (default=155).",
+)
+parser.add_argument(
+    "-p",
+    "--percentage",
+    default=0.02,
+    type=float,
+    help=(
+        "Percentage threshold to perform bitscore filtering on strict "
+        "(default=0.02)."
+    ),
+)
+parser.add_argument(
+    "-c",
+    "--cutoff",
+    default="99 97 95 90 85 80",
+    help=(
+        "Similarity cutoffs for the ranks species, genus, family, order, class, "
+        "phylum, divided by only spaces (default='99 97 95 90 85 80')."
+    ),
+)
+parser.add_argument(
+    "-T", "--threads", default=16, type=int, help="Number of threads (default=16)."
+)
+parser.add_argument(
+    "-s",
+    "--shards",
+    default=1,
+    type=int,
+    help=(
+        "Number of shards the query .fasta is split into for -f fasta, one blastn "
+        "with -T / -s threads runs per shard at the same time (default=1)."
+    ),
+)
+parser.add_argument(
+    "-n",
+    "--chunksize",
+    default=1000000,
+    type=int,
+    help="Number of BLAST rows processed per chunk (default=1000000).",
+)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.format == "fasta" and not args.db:
+        parser.error("option -d must be set when using -f fasta")
+    cutoffs = [float(cutoff) for cutoff in args.cutoff.split()]
+    if len(cutoffs) != 6:
+        parser.error("option -c needs 6 cutoffs")
+
+    start = time.time()
+    print(f"Input (-i) was defined as {args.input}")
+    print(f"Database (-d) was defined as {args.db}")
+    print(f"Type (-t) was set to {args.filtering}")
+    print(f"Bitscore threshold (-b) is {args.bitscore}")
+    print(f"Percentage threshold (-p) is {args.percentage}")
+    print(f"Cutoff (-c) is {args.cutoff}")
+    print(f"{args.threads} threads were used")
+    print(f"Query .fasta split into {args.shards} shards (-s)")
+    print(f"Script started with full command: {' '.join(sys.argv)}")
+
+    os.makedirs("blast_filtering_results", exist_ok=True)
+
+    time_print("Loading taxonomy...")
+    if args.index:
+        index = TaxonomyIndex(args.index)
+    else:
+        index = TaxonomyIndex.from_taxonomy(*read_sqlite_taxonomy(args.etetoolkit))
+
+    pipeline_args = (
+        index,
+        args.filtering,
+        args.bitscore,
+        args.percentage,
+        cutoffs,
+        args.chunksize,
+    )
+    if args.format == "fasta":
+        # BLAST shards concurrently, blastn output is read straight from stdout
+        time_print("Running blastn against db and filtering hits...")
+        shards = shard_fasta(args.input, args.shards)
+        shard_threads = max(1, args.threads // len(shards)) if shards else 1
+        filtered, n_hits = [], 0
+        blastns = []
+        try:
+            for shard in shards:
+                blastns.append(start_blastn(shard, args.db, shard_threads))
+        except OSError as error:
+            stop_blastns(blastns)
+            sys.exit(f"Could not start blastn: {error}")
+        with ThreadPoolExecutor(max(1, len(shards))) as executor:
+            futures = {
+                executor.submit(blast_shard, blastn, *pipeline_args): i
+                for i, blastn in enumerate(blastns, 1)
+            }
+            for future in as_completed(futures):
+                try:
+                    shard_filtered, shard_hits = future.result()
+                except Exception as error:
+                    stop_blastns(blastns)
+                    sys.exit(
+                        f"Shard {futures[future]}: {type(error).__name__}: {error}"
+                    )
+                filtered += shard_filtered
+                n_hits += shard_hits
+                time_print(f"Shard {futures[future]} of {len(shards)} done.")
+        name = "blast_output"
+    else:
+        time_print("Assigning taxonomy and filtering hits...")
+        if args.input == "-":
+            blast = sys.stdin
+            name = "blast_output"
+        else:
+            blast = open(args.input)
+            name = os.path.basename(args.input)
+            name = name[: -len(".txt")] if name.endswith(".txt") else name
+        filtered, n_hits = run_pipeline(blast, *pipeline_args)
+        blast.close()
+
+    # Sort sequences by name and save df
+    out = os.path.join(
+        "blast_filtering_results", name + output_suffixes[args.filtering]
+    )
+    df = write_filtered(filtered, out)
+
+    seconds = time.time() - start
+    time_print(
+        f"Filtered {n_hits} hits of {len(df)} sequences in {seconds:.1f} s "
+        f"({n_hits / max(seconds, 1e-9):.0f} rows/sec), saved to {out}."
+    )
@@ -1,38 +1,166 @@
+#!/usr/bin/env python3
+
+"""
+A script to convert the contig coverages of assembly and taxonomy .csv files
+(one per sample, with columns contigLength, coverage and the taxonomic ranks) into
+relative abundances of taxa. The abundance of a taxon is its average per-base
+coverage (summed covered bases / summed contig length), divided by the sum of
+all taxa.
+
+Samples are given as files or glob patterns, or as manifest with one file per
+line (optionally preceded by a sample name and a tab). They are processed in a
+pool of worker processes and written into one abundance table, either in long
+format (one row per sample and taxon) or in wide format (one row per taxon, one
+column per sample). Sample names default to the file names without
+"_assembly_and_taxonomy.csv" (or ".csv").
+
+Usage: convert_coverage_to_relAbundance.py RSDE_*_assembly_and_taxonomy.csv -o abundance.csv
+
+By Chris Hempel (christopher.hempel@kaust.edu.sa) on 18 Oct 2026
+"""
+
+import os
+import sys
+import glob
+import argparse
+import multiprocessing
 import pandas as pd
 
-file = f"/Users/christopherhempel/Desktop/KAUST_student_work/elisa/deepseep/kraken2_deepseep/RSDE_{i}_assembly_and_taxonomy.csv"
-df = pd.read_csv(file)
-df["covered_bases"] = df["contigLength"] * df["coverage"]
-df_small = df[
-    [
-        "superkingdom",
-        "phylum",
-        "class",
-        "order",
-        "family",
-        "genus",
-        "species",
-        "covered_bases",
-        "contigLength",
-    ]
+# Define the taxonomic ranks taxa are made of
+ranks = [
+    "superkingdom",
+    "phylum",
+    "class",
+    "order",
+    "family",
+    "genus",
+    "species",
 ]
 
-df_agg = (
-    df_small.groupby(list(df_small.columns)[:-2])[["covered_bases", "contigLength"]]
-    .sum()
-    .reset_index()
+
+# Define function to get the sample name of a file
+def sample_name(file):
+    name = os.path.basename(file)
+    for suffix in ["_assembly_and_taxonomy.csv", ".csv"]:
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return name
+
+
+# Define function to read in the samples of a manifest as list of (sample, file)
+def read_manifest(manifest):
+    samples = []
+    with open(manifest) as manifest_file:
+        for line in manifest_file:
+            fields = line.rstrip("\n").split("\t")
+            if not fields[0] or fields[0].startswith("#"):
+                continue
+            if len(fields) == 1:
+                samples.append((sample_name(fields[0]), fields[0]))
+            else:
+                samples.append((fields[0], fields[1]))
+    return samples
+
+
+# Define function to calculate the relative abundances of the taxa of one
+# sample, sorted by abundance
+def rel_abundance(file):
+    df = pd.read_csv(file, usecols=ranks + ["contigLength", "coverage"])
+    df["covered_bases"] = df["contigLength"] * df["coverage"]
+    df_agg = df.groupby(ranks)[["covered_bases", "contigLength"]].sum().reset_index()
+    #### Determine average per-base coverage for each taxon
+    df_agg["per_base_coverage"] = df_agg["covered_bases"] / df_agg["contigLength"]
+    df_agg = df_agg.drop(["contigLength", "covered_bases"], axis=1)
+    #### Turn coverages into relative abundances:
+    df_agg["per_base_coverage"] = (
+        df_agg["per_base_coverage"] / df_agg["per_base_coverage"].sum()
+    )
+    ### Rename counts col
+    df_agg.rename(columns={"per_base_coverage": "rel_abun"}, inplace=True)
+    return df_agg.sort_values("rel_abun", ascending=False)
+
+
+# Define function to calculate the relative abundances of a (sample, file) tuple
+# in a worker, with the sample as first column
+def sample_abundance(sample):
+    name, file = sample
+    df = rel_abundance(file)
+    df.insert(0, "sample", name)
+    return df
+
+
+# Define function to turn a long abundance table into a wide table with one
+# column per sample (0 if a taxon is absent), sorted by the summed abundances
+def wide_table(df, samples):
+    wide = df.pivot(index=ranks, columns="sample", values="rel_abun")
+    wide = wide.reindex(columns=samples).fillna(0)
+    wide = wide.iloc[(-wide.sum(axis=1)).argsort(kind="stable")]
+    wide.columns.name = None
+    return wide.reset_index()
+
+
+# Define arguments
+parser = argparse.ArgumentParser(
+    description="Convert contig coverages of samples into relative abundances of taxa."
+)
+parser.add_argument(
+    "files",
+    nargs="*",
+    help="Assembly and taxonomy .csv files of the samples, or glob patterns of them.",
+)
+parser.add_argument(
+    "-m",
+    "--manifest",
+    help=(
+        "File with one assembly and taxonomy .csv file per line, optionally "
+        "preceded by a sample name and a tab (instead of or in addition to files)."
+    ),
 )
-#### Determine average per-base coverage for each taxon
-df_agg["per_base_coverage"] = df_agg["covered_bases"] / df_agg["contigLength"]
-df_agg = df_agg.drop(["contigLength", "covered_bases"], axis=1)
-#### Turn coverages into relative abundances:
-df_agg["per_base_coverage"] = (
-    df_agg["per_base_coverage"] / df_agg["per_base_coverage"].sum()
+parser.add_argument(
+    "-f",
+    "--format",
+    choices=["long", "wide"],
+    default="long",
+    help=(
+        "Format of the abundance table: long (columns sample, ranks, rel_abun) "
+        "or wide (columns ranks, one column per sample) (default=long)."
+    ),
 )
-### Rename counts col
-df_agg.rename(columns={"per_base_coverage": "rel_abun"}, inplace=True)
-df_agg = df_agg.sort_values("rel_abun", ascending=False)
-df_agg.to_csv(
-    f"/Users/christopherhempel/Desktop/KAUST_student_work/elisa/deepseep/kraken2_deepseep/RSDE_{i}_assembly_and_taxonomy_abudance.csv",
-    index=False,
+parser.add_argument(
+    "-w",
+    "--workers",
+    default=os.cpu_count(),
+    type=int,
+    help="Number of worker processes to process samples with (default=all cores).",
 )
+parser.add_argument(
+    "-o",
+    "--out",
+    default="abundance.csv",
+    help="Name of output file, in .csv format (default=abundance.csv).",
+)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    # Collect samples, patterns without matches are taken as file names so that
+    # missing files are reported
+    samples = []
+    for pattern in args.files:
+        files = sorted(glob.glob(pattern)) or [pattern]
+        samples += [(sample_name(file), file) for file in files]
+    if args.manifest:
+        samples += read_manifest(args.manifest)
+    if not samples:
+        parser.error("no files or manifest given")
+    names = [name for name, _ in samples]
+    if len(set(names)) != len(names):
+        sys.exit("Sample names are not unique.")
+
+    # Process samples, results are returned in sample order
+    with multiprocessing.Pool(min(args.workers, len(samples))) as pool:
+        df = pd.concat(pool.map(sample_abundance, samples, chunksize=1))
+
+    if args.format == "wide":
+        df = wide_table(df, names)
+    df.to_csv(args.out, index=False)
@@ -1,11 +1,18 @@
 """
 Generates read number bar graphs for taxa in ESV tables.
 
+The ESV table is held as sparse ESV x sample matrix of read numbers, and the reads
+of the taxa of all ranks are summed up at once by multiplying it with a sparse
+one-hot matrix that assigns each ESV to its taxon per rank, so that memory scales
+with the number of non-zero read numbers rather than ESVs x samples.
+
 By Chris Hempel (christopher.hempel@kaust.edu.sa) on Jun 27 2023
 """
 
+import numpy as np
 import pandas as pd
 import plotly.express as px
+from scipy import sparse
 
 # Options
 file = "/Users/christopherhempel/Desktop/RSDE COI water project/second_run_with_dnoise_swarm/rsde-coi-water_final-OTU-table_coil-filtered.xlsx"
@@ -18,31 +25,85 @@ sample_abbrev = "RSDE"
 graph_width = 1200
 # Max number of taxa in plot so that names are readable
 num_taxa_barplots = 50
+# Number of ESVs read in at once from .csv files, so that only that many rows are
+# held dense before they're converted to sparse
+chunksize = 10000
 
 
-# Import ESV table
-df = pd.read_excel(file) if ".xlsx" in file else pd.read_csv(file)
+# Define function to read in an ESV table as dataframe of the taxonomy columns
+# and sparse ESV x sample matrix of read numbers (sample columns contain
+# sample_abbrev)
+def read_esv_table(file, sample_abbrev, ranks):
+    if ".xlsx" in file:
+        chunks = [pd.read_excel(file)]
+    else:
+        chunks = pd.read_csv(file, chunksize=chunksize)
+    taxonomy_chunks, count_chunks = [], []
+    for chunk in chunks:
+        sample_cols = [col for col in chunk.columns if sample_abbrev in col]
+        taxonomy_cols = [col for col in ranks + ["lowest_rank"] if col in chunk.columns]
+        taxonomy_chunks.append(chunk[taxonomy_cols])
+        count_chunks.append(sparse.csr_matrix(chunk[sample_cols].fillna(0).to_numpy()))
+    return (
+        pd.concat(taxonomy_chunks, ignore_index=True),
+        sparse.vstack(count_chunks, format="csr"),
+        sample_cols,
+    )
 
-# Select sample columns
-sample_cols = [col for col in df.columns if sample_abbrev in col]
 
-# Calculate number of reads across samples
-readsums = df[sample_cols].sum(axis=1)
+# Define function to make the one-hot rank assignment matrix (ESVs x taxa of all
+# ranks): the taxa of each rank are factorized into a block of columns, and each
+# ESV has a 1 in the column of its taxon of each rank (none if the rank is empty).
+# Also returns the taxa and the first column of each rank's block
+def rank_assignment(df, ranks, dtype):
+    rows, cols, rank_taxa = [], [], {}
+    n_taxa = 0
+    for rank in ranks:
+        codes, taxa = pd.factorize(df[rank], sort=True)
+        assigned = np.flatnonzero(codes >= 0)
+        rows.append(assigned)
+        cols.append(codes[assigned] + n_taxa)
+        rank_taxa[rank] = (taxa, n_taxa)
+        n_taxa += len(taxa)
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    assignment = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=dtype), (rows, cols)), shape=(len(df), n_taxa)
+    )
+    return assignment, rank_taxa
 
-# Plot read abundances of taxa across ranks
+
+# Define function to sum up the reads of the taxa of all ranks in one sparse
+# product, returns a sparse taxa x sample matrix per rank
+def rank_abundances(df, counts, ranks):
+    assignment, rank_taxa = rank_assignment(df, ranks, counts.dtype)
+    taxa_counts = (assignment.T @ counts).tocsr()
+    return {
+        rank: (taxa, taxa_counts[first : first + len(taxa)])
+        for rank, (taxa, first) in rank_taxa.items()
+    }
+
+
+# Define ranks
 if boldigger:
     ranks = ["Phylum", "Class", "Order", "Family", "Genus", "Species"]
 else:
     ranks = ["superkingdom", "phylum", "class", "order", "family", "genus", "species"]
+
+# Import ESV table
+df, counts, sample_cols = read_esv_table(file, sample_abbrev, ranks)
+
+# Sum up the reads of the taxa of all ranks
+rank_counts = rank_abundances(df, counts, ranks)
+
+# Plot read abundances of taxa across ranks
 ## Loop over ranks
 for rank in ranks:
-    ## Group taxa and sum up number of reads
-    rank_df = pd.DataFrame({rank: df[rank], "readsum": readsums})
-    grouped_df = (
-        rank_df.groupby([rank])
-        .sum()
-        .sort_values(["readsum"], ascending=False)[:num_taxa_barplots]
-    )
+    ## Sum up number of reads of taxa across samples
+    taxa, taxa_counts = rank_counts[rank]
+    grouped_df = pd.DataFrame(
+        {"readsum": np.asarray(taxa_counts.sum(axis=1)).ravel()},
+        index=pd.Index(taxa, name=rank),
+    ).sort_values(["readsum"], ascending=False, kind="stable")[:num_taxa_barplots]
     # Turn to proportions
     grouped_df = grouped_df / grouped_df.sum()
 
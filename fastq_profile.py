@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+"""
+A script to profile the quality of FASTQ files (plain or .gz compressed), as a
+fast alternative to FastQC for comparing read sets, e.g. reads trimmed at
+different PHRED scores (fastqc_on_R1_R2_and_optional_trimming.sh -q profile).
+
+Per file, it calculates the number of reads and bases, the per-position mean and
+quantiles (10, 25, 50, 75, 90) of quality scores and percentage of Ns, the read
+length histogram and the histogram of Ns per read. Files are read in large blocks
+of complete records, whose quality strings and sequences are decoded with NumPy
+all at once, and each file is profiled in its own worker process.
+
+Output is a .json file with the full profiles of all files, or a .tsv file with
+one summary row per file (reads, bases, mean length, mean quality, percentage of
+bases with quality >= 20 and >= 30, percentage of Ns).
+
+By Chris Hempel (christopher.hempel@kaust.edu.sa) on 18 Oct 2026
+"""
+
+import os
+import gzip
+import json
+import argparse
+import datetime
+import multiprocessing
+import numpy as np
+from functools import partial
+
+# Define the number of possible quality scores (printable ASCII characters from
+# the PHRED offset on), and the quantiles that are calculated per position
+max_quality = 94
+quantiles = [10, 25, 50, 75, 90]
+
+
+# Define funtion to print datetime and text
+def time_print(text):
+    datetime_now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"{datetime_now}  ---  " + text)
+
+
+# Define function to open plain or .gz compressed FASTQ files
+def open_fastq(file):
+    return gzip.open(file, "rb") if file.endswith(".gz") else open(file, "rb")
+
+
+# Define function to read in a FASTQ file in blocks of block_size bytes, yields
+# the sequences and quality strings of the complete records of each block. The
+# incomplete record at the end of a block is carried over to the next block
+def read_blocks(file, block_size):
+    rest = b""
+    with open_fastq(file) as fastq:
+        while True:
+            data = fastq.read(block_size)
+            lines = (rest + data).split(b"\n")
+            if data:
+                n_records = (len(lines) - 1) // 4
+            else:
+                while lines and not lines[-1]:
+                    lines.pop()
+                if len(lines) % 4:
+                    raise ValueError(f"{file} ends with an incomplete record.")
+                n_records = len(lines) // 4
+            if n_records:
+                yield lines[1 : 4 * n_records : 4], lines[3 : 4 * n_records : 4]
+            if not data:
+                return
+            rest = b"\n".join(lines[4 * n_records :])
+
+
+# Define function to add counts to total counts, which are extended if the counts
+# are longer (along the first axis)
+def add_counts(total, counts):
+    if len(counts) > len(total):
+        total = np.concatenate(
+            [total, np.zeros((len(counts) - len(total),) + total.shape[1:], np.int64)]
+        )
+    total[: len(counts)] += counts
+    return total
+
+
+# Define function to calculate quantiles from counts of quality scores per
+# position: the quantile is the lowest score that at least that percentage of
+# scores is lower or equal to (same as numpy's "inverted_cdf" method)
+def count_quantiles(quality_counts, quantile):
+    cumulative_counts = np.cumsum(quality_counts, axis=1)
+    ranks = np.maximum(np.ceil(cumulative_counts[:, -1] * quantile / 100), 1)
+    return (cumulative_counts < ranks[:, None]).sum(axis=1)
+
+
+# Define function to profile a FASTQ file
+def profile_fastq(file, phred_offset=33, block_size=16 * 1024**2):
+    quality_counts = np.zeros((0, max_quality), dtype=np.int64)
+    n_counts = np.zeros(0, dtype=np.int64)
+    length_counts = np.zeros(0, dtype=np.int64)
+    n_read_counts = np.zeros(0, dtype=np.int64)
+    for sequences, qualities in read_blocks(file, block_size):
+        lengths = np.fromiter(map(len, qualities), dtype=np.int64, count=len(qualities))
+        scores = np.frombuffer(b"".join(qualities), dtype=np.uint8).astype(np.int64)
+        scores -= phred_offset
+        bases = np.frombuffer(b"".join(sequences), dtype=np.uint8)
+        if len(bases) != len(scores):
+            raise ValueError(f"{file} has sequences and quality strings of different lengths.")
+        if len(scores) and (scores.min() < 0 or scores.max() >= max_quality):
+            raise ValueError(f"{file} has quality scores outside of PHRED+{phred_offset}.")
+
+        # Get the position of each base in its read and the index of its read
+        read_index = np.repeat(np.arange(len(lengths)), lengths)
+        positions = np.arange(len(scores)) - (np.cumsum(lengths) - lengths)[read_index]
+        n_positions = lengths.max(initial=0)
+
+        quality_counts = add_counts(
+            quality_counts,
+            np.bincount(
+                positions * max_quality + scores, minlength=n_positions * max_quality
+            ).reshape(n_positions, max_quality),
+        )
+        is_n = (bases | 32) == ord("n")
+        n_counts = add_counts(n_counts, np.bincount(positions[is_n], minlength=n_positions))
+        length_counts = add_counts(length_counts, np.bincount(lengths))
+        n_read_counts = add_counts(
+            n_read_counts,
+            np.bincount(np.bincount(read_index[is_n], minlength=len(lengths))),
+        )
+
+    # Summarize counts
+    reads = int(length_counts.sum())
+    position_reads = quality_counts.sum(axis=1)
+    n_bases = int(position_reads.sum())
+    score_counts = quality_counts.sum(axis=0)
+    scores = np.arange(max_quality)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        per_position = {
+            "reads": position_reads.tolist(),
+            "mean": np.round(quality_counts @ scores / position_reads, 3).tolist(),
+        }
+        per_position.update(
+            {
+                f"q{quantile}": count_quantiles(quality_counts, quantile).tolist()
+                for quantile in quantiles
+            }
+        )
+        per_position["n_percent"] = np.round(n_counts / position_reads * 100, 3).tolist()
+    return {
+        "file": file,
+        "reads": reads,
+        "bases": n_bases,
+        "mean_length": round(n_bases / max(reads, 1), 3),
+        "mean_quality": round(float(score_counts @ scores) / max(n_bases, 1), 3),
+        "q20_percent": round(float(score_counts[20:].sum()) / max(n_bases, 1) * 100, 3),
+        "q30_percent": round(float(score_counts[30:].sum()) / max(n_bases, 1) * 100, 3),
+        "n_percent": round(float(n_counts.sum()) / max(n_bases, 1) * 100, 3),
+        "length_histogram": {
+            str(length): int(count)
+            for length, count in enumerate(length_counts)
+            if count
+        },
+        "n_histogram": {
+            str(n): int(count) for n, count in enumerate(n_read_counts) if count
+        },
+        "per_position": per_position,
+    }
+
+
+# Define the columns of the .tsv summary
+summary_columns = [
+    "file",
+    "reads",
+    "bases",
+    "mean_length",
+    "mean_quality",
+    "q20_percent",
+    "q30_percent",
+    "n_percent",
+]
+
+
+# Define function to write the profiles to a .json file, or their summaries to a
+# .tsv file
+def write_profiles(profiles, out):
+    with open(out, "w") as out_file:
+        if out.endswith(".json"):
+            json.dump(profiles, out_file, separators=(",", ":"))
+            out_file.write("\n")
+        else:
+            out_file.write("\t".join(summary_columns) + "\n")
+            for profile in profiles:
+                out_file.write(
+                    "\t".join(str(profile[column]) for column in summary_columns)
+                    + "\n"
+                )
+
+
+# Define arguments
+parser = argparse.ArgumentParser(description="Profile the quality of FASTQ files.")
+parser.add_argument(
+    "files", nargs="+", help="FASTQ files (can also be .gz compressed)."
+)
+parser.add_argument(
+    "-o",
+    "--out",
+    required=True,
+    action="append",
+    help=(
+        "Name of output file, can be given several times. Profiles are written "
+        "in .json format if the name ends with .json, otherwise a summary per "
+        "file in .tsv format."
+    ),
+)
+parser.add_argument(
+    "-w",
+    "--workers",
+    default=os.cpu_count(),
+    type=int,
+    help="Number of worker processes, one file per process (default=all cores).",
+)
+parser.add_argument(
+    "-p",
+    "--phred_offset",
+    default=33,
+    type=int,
+    help="Offset of quality scores (default=33).",
+)
+parser.add_argument(
+    "-b",
+    "--block_size",
+    default=16,
+    type=int,
+    help="Size of blocks files are read in, in MB (default=16).",
+)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    time_print(f"Profiling {len(args.files)} files...")
+    profile = partial(
+        profile_fastq,
+        phred_offset=args.phred_offset,
+        block_size=args.block_size * 1024**2,
+    )
+    with multiprocessing.Pool(min(args.workers, len(args.files))) as pool:
+        profiles = pool.map(profile, args.files, chunksize=1)
+    for out in args.out:
+        write_profiles(profiles, out)
+    time_print("Profiling done.")
@@ -7,19 +7,26 @@
 
 # Takes R1 and R2 reads, performs FastQC on the raw reads, then, if specified,
 # trims them using Trimmomatic with a list of PHRED scores and performs FastQC
-# on all trimmed read sets
+# on all trimmed read sets. Instead of FastQC, fastq_profile.py can be used
+# (-q profile), which profiles all read sets at once into one .json and one .tsv
+# file that can be compared across PHRED scores, and must then be in your PATH
+
+# All Trimmomatic and FastQC runs are run in parallel within the number of
+# threads (-p), see the job scheduler below. Java and FastQC are called from
+# your PATH, so they can be replaced by stub executables for testing
 
 # FastQC must be installed and in path
 
 # A folder with adapters to trim must be located in the same folder as the
 # trimmomatic .jar application and called "adapters" (that's usually the case
 # when you install trimmomatic).
-# For now, the used adapter sequences are fixed, and can be changed in line 122
+# For now, the used adapter sequences are fixed, and can be changed in the
+# Trimmomatic command (ILLUMINACLIP)
 
 # For some reason, the limit of the PHRED score can only be set to 38, FastQC is
 # not able to deal with data generated with higher PHRED scores (in my test).
 
-usage="$(basename "$0") -1 <R1.fastq> -2 <R2.fastq> -t <yes|no> [-T <path/to/trimmomatic.jar> -P <'score score score ...'> -l <length> -p <threads>]
+usage="$(basename "$0") -1 <R1.fastq> -2 <R2.fastq> -t <yes|no> [-T <path/to/trimmomatic.jar> -P <'score score score ...'> -l <length> -p <threads> -q <fastqc|profile>]
 
 Usage:
 	-1  Reads1 (can also be .gz compressed)
@@ -28,17 +35,19 @@ Usage:
 	-T  Path to trimmomatic java application (.jar)
 	-P  PHRED scores to trim on (default: '5 10 15 20' (numbers must be surrounded by ' ' and separated only by space); based on recommendations of MacMarnes 2014 and a literature review of papers that cite them)
 	-l  Minimum read length to keep (default: 25 , based on recommendations of MacMarnes 2014 and a literature review of papers that cite them)
-	-p  Number of threads used	(default: 16)
+	-p  Number of threads used by all Trimmomatic and FastQC runs together	(default: 16)
+	-q  fastqc: run FastQC on all read sets; profile: run fastq_profile.py on all read sets at once, a fast alternative to FastQC (default: fastqc)
 	-h  Display this help and exit"
 
 # Set default options:
 PHRED='5 10 15 20'
 min_length='25'
 threads='16'
+quality_control='fastqc'
 
 
 # Set specified options:
-while getopts ':1:2:t:T:P:l:p:h' opt; do
+while getopts ':1:2:t:T:P:l:p:q:h' opt; do
   case "${opt}" in
   	1) R1="${OPTARG}" ;;
 	  2) R2="${OPTARG}" ;;
@@ -47,6 +56,7 @@ while getopts ':1:2:t:T:P:l:p:h' opt; do
 		P) PHRED="${OPTARG}" ;;
 		l) min_length="${OPTARG}" ;;
 		p) threads="${OPTARG}" ;;
+		q) quality_control="${OPTARG}" ;;
 		h) echo "$usage"
 		   exit ;;
 		:) printf "Option -$OPTARG requires an argument."
@@ -77,6 +87,14 @@ then
   exit
 fi
 
+if [[ $quality_control != 'fastqc' && $quality_control != 'profile' ]]
+then
+  echo -e "Invalid option for -q, must be set to either 'fastqc' or 'profile'\n"
+  echo -e "$usage\n\n"
+  echo -e "Exiting script\n"
+  exit
+fi
+
 if [[ $trimming == 'yes' && $trimmomatic == '' ]]
 then
   echo -e "Option -T must be set when using -t yes.'\n"
@@ -112,50 +130,160 @@ else
 	echo -e "Minimum length of reads is $min_length."
 fi
 echo -e "Number of threads was set to $threads."
+echo -e "Quality control was set to $quality_control."
+
+##### Job scheduler #####
+
+# Trimmomatic and FastQC runs are jobs of a DAG: every job has a number of cores
+# and optionally a job it depends on. A job is started as soon as the job it
+# depends on is done and enough cores of the core budget (-p) are free, so that
+# all PHRED scores are trimmed at the same time and FastQC runs on each trimmed
+# set as soon as it exists. The output of each job is written into its own log
+# file in logs/, which is added to the output of the script when the job is
+# done. If a job fails, the jobs that depend on it are skipped
+
+declare -a job_order
+declare -A job_cores job_dependency job_command job_state job_pid
+
+# Usage: add_job <name> <cores> <dependency or ""> <command...>
+add_job() {
+	local name=$1 cores=$2 dependency=$3
+	shift 3
+	if (( cores > threads )); then
+		cores=$threads
+	fi
+	job_order+=("$name")
+	job_cores[$name]=$cores
+	job_dependency[$name]=$dependency
+	job_command[$name]=$(printf '%q ' "$@")
+	job_state[$name]=waiting
+}
+
+run_jobs() {
+	local free_cores=$threads running=0 waiting name dependency status
+	mkdir -p fastqc_on_R1_R2_and_optional_trimming_output/logs
+	# Jobs report their name and exit status through a FIFO when they're done
+	local fifo=fastqc_on_R1_R2_and_optional_trimming_output/logs/.jobs_fifo
+	mkfifo $fifo
+	exec 3<>$fifo
+	rm $fifo
+	while :; do
+		# Start all waiting jobs that are ready and fit into the free cores, in the
+		# order they were added
+		waiting=0
+		for name in "${job_order[@]}"; do
+			[[ ${job_state[$name]} == waiting ]] || continue
+			dependency=${job_dependency[$name]}
+			if [[ -n $dependency && ${job_state[$dependency]} =~ ^(failed|skipped)$ ]]; then
+				job_state[$name]=skipped
+				echo -e "Skipping $name, as $dependency didn't finish.\n"
+				continue
+			fi
+			waiting=1
+			if [[ (-z $dependency || ${job_state[$dependency]} == done) \
+			&& ${job_cores[$name]} -le $free_cores ]]; then
+				(
+					eval "${job_command[$name]}" \
+					> fastqc_on_R1_R2_and_optional_trimming_output/logs/$name.log 2>&1
+					echo "$name $?" >&3
+				) &
+				job_pid[$name]=$!
+				job_state[$name]=running
+				(( free_cores -= job_cores[$name] , running += 1 ))
+				echo -e "Started $name on ${job_cores[$name]} core(s).\n"
+			fi
+		done
+		if (( running == 0 )); then
+			break
+		fi
+		# Wait for the next job to be done
+		read -r name status <&3
+		wait ${job_pid[$name]}
+		(( free_cores += job_cores[$name] , running -= 1 ))
+		cat fastqc_on_R1_R2_and_optional_trimming_output/logs/$name.log
+		if [[ $status == 0 ]]; then
+			job_state[$name]=done
+			echo -e "\nFinished $name.\n"
+		else
+			job_state[$name]=failed
+			echo -e "\n$name failed with exit status $status.\n"
+		fi
+	done
+	exec 3>&-
+}
 
 ##### Start of script #####
 
 baseout=$(echo ${R1%_*}) # Make basename
 
+if [[ $quality_control == "fastqc" ]] ; then
+	mkdir fastqc_on_R1_R2_and_optional_trimming_output/fastqc_reports
+	mkdir fastqc_on_R1_R2_and_optional_trimming_output/fastqc_reports/untrimmed_${baseout##*/}
+fi
+
 if [[ $trimming == "yes" ]] ; then
-	# Running Trimmomatic
-	echo -e "\n\n~~~~~~~~~~ RUNNING TRIMMOMATIC ~~~~~~~~~~\n"
+	# Running Trimmomatic for every specified PHRED score at the same time, with
+	# the cores divided among them, and save output in separate directory
 	mkdir fastqc_on_R1_R2_and_optional_trimming_output/trimmomatic/
+	trimming_threads=$(( threads / $(echo $PHRED | wc -w) ))
+	if (( trimming_threads < 1 )); then
+		trimming_threads=1
+	fi
 	for score in $PHRED; do
-		# Run trimmomatic for every specified PHRED score and save output in separate directory
-		mkdir fastqc_on_R1_R2_and_optional_trimming_output/trimmomatic/trimmed_at_phred_$(echo $score)_$(echo ${baseout##*/})
+		trimmed=trimmed_at_phred_$(echo $score)_$(echo ${baseout##*/})
+		mkdir fastqc_on_R1_R2_and_optional_trimming_output/trimmomatic/${trimmed}
+		add_job trimmomatic_phred_${score} $trimming_threads "" \
 		java -jar $trimmomatic PE $R1 $R2 ILLUMINACLIP:$(echo ${trimmomatic%/*})/adapters/TruSeq3-PE.fa:2:30:10 LEADING:$score TRAILING:$score SLIDINGWINDOW:4:$score MINLEN:$min_length \
-		-baseout trimmed_at_phred_$(echo $score)_$(echo ${baseout##*/}).fastq \
-		-threads $threads
-		echo -e '\n'
-		mv trimmed_at_phred_$(echo $score)_$(echo ${baseout##*/})*.fastq \
-		fastqc_on_R1_R2_and_optional_trimming_output/trimmomatic/trimmed_at_phred_$(echo $score)_$(echo ${baseout##*/})
+		-baseout fastqc_on_R1_R2_and_optional_trimming_output/trimmomatic/${trimmed}/${trimmed}.fastq \
+		-threads $trimming_threads
+		# Run FastQC on the trimmed paired reads once they're trimmed
+		if [[ $quality_control == "fastqc" ]] ; then
+			mkdir fastqc_on_R1_R2_and_optional_trimming_output/fastqc_reports/${trimmed}
+			for pair in 1P 2P; do
+				add_job fastqc_phred_${score}_${pair} 1 trimmomatic_phred_${score} \
+				fastqc fastqc_on_R1_R2_and_optional_trimming_output/trimmomatic/${trimmed}/${trimmed}_${pair}.fastq \
+				-o fastqc_on_R1_R2_and_optional_trimming_output/fastqc_reports/${trimmed}
+			done
+		fi
 	done
 fi
 
-# Running FastQC
-echo -e "\n\n~~~~~~~~~~ RUNNING FASTQC ~~~~~~~~~~\n"
-mkdir fastqc_on_R1_R2_and_optional_trimming_output/fastqc_reports
-mkdir fastqc_on_R1_R2_and_optional_trimming_output/fastqc_reports/untrimmed_${baseout##*/}
-fastqc $R1 -o fastqc_on_R1_R2_and_optional_trimming_output/fastqc_reports/untrimmed_${baseout##*/}
-echo -e "\n"
-fastqc $R2 -o fastqc_on_R1_R2_and_optional_trimming_output/fastqc_reports/untrimmed_${baseout##*/}
-echo -e "\n"
-
-#  Run FastQC on trimmed data if trimming was activated:
-if [[ $trimming == "yes" ]] ; then
-	for reads in fastqc_on_R1_R2_and_optional_trimming_output/trimmomatic/trimmed_at_phred_*$(echo ${baseout##*/})/*_1P.fastq; do
-		dir_name=${reads%_*} # making variable so that read names can be used to make directory
-		mkdir fastqc_on_R1_R2_and_optional_trimming_output/fastqc_reports/$(echo ${dir_name##*/})
-		fastqc $reads -o fastqc_on_R1_R2_and_optional_trimming_output/fastqc_reports/$(echo ${dir_name##*/}) -t $threads
-		echo -e "\n"
-	done
+# Running FastQC on the raw reads
+if [[ $quality_control == "fastqc" ]] ; then
+	add_job fastqc_untrimmed_R1 1 "" \
+	fastqc $R1 -o fastqc_on_R1_R2_and_optional_trimming_output/fastqc_reports/untrimmed_${baseout##*/}
+	add_job fastqc_untrimmed_R2 1 "" \
+	fastqc $R2 -o fastqc_on_R1_R2_and_optional_trimming_output/fastqc_reports/untrimmed_${baseout##*/}
+fi
 
-	for reads in fastqc_on_R1_R2_and_optional_trimming_output/trimmomatic/trimmed_at_phred_*$(echo ${baseout##*/})/*_2P.fastq; do
-		dir_name=${reads%_*} # making variable so that read names can be used to sort into directory
-		fastqc $reads -o fastqc_on_R1_R2_and_optional_trimming_output/fastqc_reports/$(echo ${dir_name##*/}) -t $threads
-		echo -e "\n"
-	done
+if [[ $trimming == "yes" && $quality_control == "fastqc" ]] ; then
+	echo -e "\n\n~~~~~~~~~~ RUNNING TRIMMOMATIC AND FASTQC ~~~~~~~~~~\n"
+elif [[ $trimming == "yes" ]] ; then
+	echo -e "\n\n~~~~~~~~~~ RUNNING TRIMMOMATIC ~~~~~~~~~~\n"
+elif [[ $quality_control == "fastqc" ]] ; then
+	echo -e "\n\n~~~~~~~~~~ RUNNING FASTQC ~~~~~~~~~~\n"
+fi
+run_jobs
+
+# Profiling the raw reads and the read sets of all Trimmomatic runs that finished
+# in one run, one file per core (files of failed runs might be incomplete)
+if [[ $quality_control == "profile" ]] ; then
+	echo -e "\n\n~~~~~~~~~~ RUNNING FASTQ_PROFILE.PY ~~~~~~~~~~\n"
+	profile_reads=($R1 $R2)
+	if [[ $trimming == "yes" ]] ; then
+		for score in $PHRED; do
+			if [[ ${job_state[trimmomatic_phred_${score}]} == done ]]; then
+				trimmed=trimmed_at_phred_$(echo $score)_$(echo ${baseout##*/})
+				for pair in 1P 2P; do
+					profile_reads+=(fastqc_on_R1_R2_and_optional_trimming_output/trimmomatic/${trimmed}/${trimmed}_${pair}.fastq)
+				done
+			fi
+		done
+	fi
+	fastq_profile.py "${profile_reads[@]}" \
+	-w $threads \
+	-o fastqc_on_R1_R2_and_optional_trimming_output/fastq_profile.json \
+	-o fastqc_on_R1_R2_and_optional_trimming_output/fastq_profile.tsv
 fi
 
 # Display runtime
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+"""
+A script to sort BLAST hit tables by qseqid and bitscore (descending) in bounded
+memory, for tables that don't fit into memory, so that the grouped filters of
+blast_filter.py (--sort) and taxonomy_filter.py (--sort) can stream them by
+qseqid.
+
+The table is read in runs of a fixed number of lines, each run is sorted in
+memory and spilled to a temporary file, and the sorted runs are merged with a
+k-way heap merge (in several passes if there are more runs than files that are
+merged at once), so that at most one run is held in memory and the total time is
+O(n log n). The sort is stable, i.e. hits with the same qseqid and bitscore keep
+their input order, and lines are written as read in.
+
+Columns are given by number (1-based, as in sort -k, default qseqid = 1 and
+bitscore = 12 as in BLAST output format 6), or by name for tables with a header.
+
+By Chris Hempel (christopher.hempel@kaust.edu.sa) on 18 Oct 2026
+"""
+
+import os
+import csv
+import heapq
+import argparse
+import datetime
+import tempfile
+
+# Define the number of sorted runs that are merged at once
+merge_fan_in = 128
+
+
+# Define funtion to print datetime and text
+def time_print(text):
+    datetime_now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"{datetime_now}  ---  " + text)
+
+
+# Define function to make the sort key of lines: qseqid, then bitscore
+# descending. Comma-separated lines are parsed as .csv, as fields might be quoted
+def hit_key(qseqid_column, bitscore_column, sep="\t"):
+    if sep == "\t":
+
+        def key(line):
+            fields = line.rstrip("\n").split("\t")
+            return fields[qseqid_column], -float(fields[bitscore_column])
+
+    else:
+
+        def key(line):
+            fields = next(csv.reader([line], delimiter=sep))
+            return fields[qseqid_column], -float(fields[bitscore_column])
+
+    return key
+
+
+# Define function to write lines into a new file in run_dir and return its name
+def spill(lines, run_dir):
+    fd, run_file = tempfile.mkstemp(suffix=".run", dir=run_dir)
+    with os.fdopen(fd, "w") as run:
+        run.writelines(lines)
+    return run_file
+
+
+# Define function to sort lines in runs of max_lines lines that are spilled to
+# files in run_dir, returns the names of the run files in input order
+def sorted_runs(lines, key, max_lines, run_dir):
+    run_files = []
+    run = []
+    for line in lines:
+        if not line.endswith("\n"):
+            line += "\n"
+        run.append(line)
+        if len(run) == max_lines:
+            run_files.append(spill(sorted(run, key=key), run_dir))
+            run = []
+    if run:
+        run_files.append(spill(sorted(run, key=key), run_dir))
+    return run_files
+
+
+# Define function to merge sorted run files, earlier runs go first for equal keys
+def merge_runs(run_files, key):
+    runs = [open(run_file) for run_file in run_files]
+    try:
+        yield from heapq.merge(*runs, key=key)
+    finally:
+        for run in runs:
+            run.close()
+
+
+# Define function to sort lines by key in bounded memory, yields the sorted lines.
+# Runs are merged in passes of merge_fan_in runs until they can be merged at once.
+# Temporary files are kept in a temporary directory in tmp_dir, which is removed
+# when sorting is done
+def external_sort(lines, key, max_lines=1000000, tmp_dir=None):
+    with tempfile.TemporaryDirectory(prefix="hit_sort_", dir=tmp_dir) as run_dir:
+        run_files = sorted_runs(lines, key, max_lines, run_dir)
+        while len(run_files) > merge_fan_in:
+            merged_files = []
+            for i in range(0, len(run_files), merge_fan_in):
+                merged_runs = run_files[i : i + merge_fan_in]
+                merged_files.append(spill(merge_runs(merged_runs, key), run_dir))
+                for run_file in merged_runs:
+                    os.remove(run_file)
+            run_files = merged_files
+        yield from merge_runs(run_files, key)
+
+
+# Define function to sort a hit table file by qseqid and bitscore (descending)
+# into out. Columns are 1-based numbers, or names if the table has a header
+def sort_hits(
+    file,
+    out,
+    qseqid_column=1,
+    bitscore_column=12,
+    header=False,
+    sep="\t",
+    max_lines=1000000,
+    tmp_dir=None,
+):
+    if tmp_dir is None:
+        tmp_dir = os.path.dirname(os.path.abspath(out))
+    with open(file) as hits, open(out, "w") as out_file:
+        if header:
+            header_line = next(hits, "")
+            out_file.write(header_line)
+            columns = next(csv.reader([header_line], delimiter=sep), [])
+            if not columns:
+                return
+            qseqid_column = columns.index(qseqid_column) + 1
+            bitscore_column = columns.index(bitscore_column) + 1
+        key = hit_key(qseqid_column - 1, bitscore_column - 1, sep)
+        lines = (line for line in hits if line.strip())
+        out_file.writelines(external_sort(lines, key, max_lines, tmp_dir))
+
+
+# Define arguments
+parser = argparse.ArgumentParser(
+    description="Sort BLAST hit tables by qseqid and bitscore (descending) in bounded memory."
+)
+parser.add_argument("-i", "--input", required=True, help="Input hit table.")
+parser.add_argument("-o", "--out", required=True, help="Name of output file.")
+parser.add_argument(
+    "-q",
+    "--qseqid_column",
+    default="1",
+    help="Number (1-based) or, with --header, name of the qseqid column (default=1).",
+)
+parser.add_argument(
+    "-b",
+    "--bitscore_column",
+    default="12",
+    help="Number (1-based) or, with --header, name of the bitscore column (default=12).",
+)
+parser.add_argument(
+    "--header",
+    action="store_true",
+    help="The first line is a header, which is kept as first line.",
+)
+parser.add_argument(
+    "-s", "--sep", default="\t", help="Column separator (default=tab)."
+)
+parser.add_argument(
+    "-m",
+    "--max_lines",
+    default=1000000,
+    type=int,
+    help="Number of lines sorted in memory at once (default=1000000).",
+)
+parser.add_argument(
+    "-T",
+    "--tmp_dir",
+    help="Directory for temporary files (default=directory of the output file).",
+)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    qseqid_column, bitscore_column = args.qseqid_column, args.bitscore_column
+    if not args.header:
+        qseqid_column, bitscore_column = int(qseqid_column), int(bitscore_column)
+
+    time_print("Sorting hits...")
+    sort_hits(
+        args.input,
+        args.out,
+        qseqid_column,
+        bitscore_column,
+        args.header,
+        args.sep,
+        args.max_lines,
+        args.tmp_dir,
+    )
+    time_print("Sorting done.")
@@ -5,6 +5,8 @@
 # Needs to have a column 'counts' with readcounts in readcount_file.
 # If the first file is empty, the script merges on the colulm sequence_name and
 # keeps the column order that way.
+# Files are read and written as tab-separated text, or as .parquet/.arrow files
+# if their names end with .parquet/.arrow (needs pyarrow).
 
 # usage: ./merge_files.py file2 file2 output_file_name
 
@@ -14,8 +16,27 @@ df1_name=sys.argv[1]
 df2_name=sys.argv[2]
 output_name=sys.argv[3]
 
-df1 = pd.read_csv(df1_name, sep='\t')
-df2 = pd.read_csv(df2_name, sep='\t')
+# Define file extensions that are read and written as columnar files
+parquet_extensions=('.parquet', '.pq')
+arrow_extensions=('.arrow', '.feather', '.ipc')
+
+def read_table(name):
+    if name.endswith(parquet_extensions):
+        return pd.read_parquet(name)
+    elif name.endswith(arrow_extensions):
+        return pd.read_feather(name)
+    return pd.read_csv(name, sep='\t')
+
+def write_table(df, name):
+    if name.endswith(parquet_extensions):
+        df.to_parquet(name, index=False)
+    elif name.endswith(arrow_extensions):
+        df.reset_index(drop=True).to_feather(name)
+    else:
+        df.to_csv(name, sep='\t', na_rep='NA', index=False)
+
+df1 = read_table(df1_name)
+df2 = read_table(df2_name)
 if df1.empty==True:
     df3 = pd.merge(df1, df2, how='outer', right_on="sequence_name", left_index=True)
     if "sequence_name_x" in df3.columns:
@@ -23,4 +44,4 @@ if df1.empty==True:
 else:
     df3 = pd.merge(df1, df2, how='outer')
 df3['counts'].fillna(0, inplace=True)
-df3.to_csv(output_name, sep='\t', na_rep='NA', index=False)
+write_table(df3, output_name)
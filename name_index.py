@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+"""
+A script to build a compact, memory-mapped index of NCBI taxonomy names to
+staxids, used to assign NCBI staxids to SILVA and CREST taxonomy paths
+(old/assign_NCBI_staxids_to_SILVA_taxonomy/, old/assign_NCBI_staxids_to_CREST/).
+
+The index is built once from NCBI's names.dmp, with the same edits as the
+NCBI_staxids_(non_)scientific.txt files of SILVA_SSU_LSU_makeblastdb_preparation.sh
+(<genus> etc. removed from names, names containing "environmental",
+"uncultured", "unidentified" or "metagenome" left out), or from these two files.
+Names are matched in lowercase, and scientific names take priority over
+non-scientific names (synonyms, misspellings, etc.). The index is a directory of
+flat arrays sorted by a 64-bit hash of the names (hash, staxid, name offset) and a
+blob of names, which are memory-mapped on load, so that loading is near-instant
+and concurrent runs share the same memory.
+
+By Chris Hempel (christopher.hempel@kaust.edu.sa) on 18 Oct 2026
+"""
+
+import os
+import re
+import csv
+import hashlib
+import argparse
+import datetime
+import numpy as np
+
+# Define the words names are left out for, as the same names are used for taxa
+# in different lineages
+excluded_words = ["environmental", "uncultured", "unidentified", "metagenome"]
+
+
+# Define funtion to print datetime and text
+def time_print(text):
+    datetime_now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"{datetime_now}  ---  " + text)
+
+
+# Define function to hash an encoded name into a 64-bit integer, independent of
+# the python process (unlike hash())
+def name_hash(name):
+    return int.from_bytes(hashlib.blake2b(name, digest_size=8).digest(), "little")
+
+
+# Define function to read in lines of a name and a staxid, divided by a tab, as
+# dictionary of lowercased name to staxid. Lines are parsed with csv.reader, as
+# the names of the SILVA/CREST taxonomies are, so that quotes around names are
+# removed on both sides
+def read_name_rows(lines):
+    return {
+        row[0]: int(row[1])
+        for row in csv.reader((line.lower() for line in lines), delimiter="\t")
+    }
+
+
+# Define function to read in the lowercased names of NCBI's names.dmp as
+# dictionary of name to staxid, scientific names overwrite non-scientific names.
+# Names are turned into the lines of the name tables below first, so that both
+# are parsed the same way
+def read_names_dmp(names_file):
+    scientific, non_scientific = [], []
+    with open(names_file) as names:
+        for line in names:
+            line = re.sub(r" <[a-zA-Z -,.&:'0-9]*>", "", line)
+            fields = line.split("\t")
+            if any(word in fields[2] for word in excluded_words):
+                continue
+            name_lines = scientific if "scientific name" in line else non_scientific
+            name_lines.append(f"{fields[2]}\t{fields[0]}\n")
+    name2staxid = read_name_rows(non_scientific)
+    name2staxid.update(read_name_rows(scientific))
+    return name2staxid
+
+
+# Define function to read in the lowercased names of the files
+# NCBI_staxids_scientific.txt and NCBI_staxids_non_scientific.txt (name and
+# staxid per line) as dictionary of name to staxid
+def read_name_tables(scientific_file, non_scientific_file):
+    name2staxid = {}
+    for names_file in [non_scientific_file, scientific_file]:
+        with open(names_file) as names:
+            name2staxid.update(read_name_rows(names))
+    return name2staxid
+
+
+# Define function to make the arrays of the index, sorted by the hashes of names.
+# The name of entry i is the slice names_bin[name_offset[i]:name_offset[i + 1]]
+def index_arrays(name2staxid):
+    encoded_names = [name.encode() for name in name2staxid]
+    hashes = np.array([name_hash(name) for name in encoded_names], dtype=np.uint64)
+    order = np.argsort(hashes, kind="stable")
+    staxids = np.fromiter(name2staxid.values(), dtype=np.int32, count=len(hashes))
+    name_length = np.array([len(name) for name in encoded_names], dtype=np.int64)
+    name_offset = np.zeros(len(hashes) + 1, dtype=np.int64)
+    np.cumsum(name_length[order], out=name_offset[1:])
+    names_bin = np.frombuffer(
+        b"".join(encoded_names[i] for i in order), dtype=np.uint8
+    )
+    return hashes[order], staxids[order], name_offset, names_bin
+
+
+# Define function to write the index
+def write_index(index_dir, name2staxid):
+    os.makedirs(index_dir, exist_ok=True)
+    hashes, staxids, name_offset, names_bin = index_arrays(name2staxid)
+    np.save(os.path.join(index_dir, "hash.npy"), hashes)
+    np.save(os.path.join(index_dir, "staxid.npy"), staxids)
+    np.save(os.path.join(index_dir, "name_offset.npy"), name_offset)
+    with open(os.path.join(index_dir, "names.bin"), "wb") as names_bin_file:
+        names_bin_file.write(names_bin.tobytes())
+
+
+# Define class to load a name index and look up staxids of names. An index can
+# also be built in memory with from_names, e.g. from the name tables
+class NameIndex:
+    def __init__(self, index_dir=None):
+        if index_dir is None:
+            return
+        self.hashes = np.load(os.path.join(index_dir, "hash.npy"), mmap_mode="r")
+        self.staxids = np.load(os.path.join(index_dir, "staxid.npy"), mmap_mode="r")
+        self.name_offset = np.load(
+            os.path.join(index_dir, "name_offset.npy"), mmap_mode="r"
+        )
+        names_file = os.path.join(index_dir, "names.bin")
+        if os.path.getsize(names_file):
+            self.names_bin = np.memmap(names_file, dtype=np.uint8, mode="r")
+        else:
+            self.names_bin = np.zeros(0, dtype=np.uint8)
+
+    @classmethod
+    def from_names(cls, name2staxid):
+        index = cls()
+        index.hashes, index.staxids, index.name_offset, index.names_bin = (
+            index_arrays(name2staxid)
+        )
+        return index
+
+    # Define method to look up the staxids of lowercased names (0 = not found).
+    # Hashes are looked up all at once, and only names with a matching hash are
+    # compared with the names in the index
+    def lookup(self, names):
+        encoded_names = [name.encode() for name in names]
+        hashes = np.array(
+            [name_hash(name) for name in encoded_names], dtype=np.uint64
+        )
+        positions = np.searchsorted(self.hashes, hashes)
+        staxids = np.zeros(len(names), dtype=np.int64)
+        for i in np.flatnonzero(positions < len(self.hashes)):
+            position = positions[i]
+            while position < len(self.hashes) and self.hashes[position] == hashes[i]:
+                name = self.names_bin[
+                    self.name_offset[position] : self.name_offset[position + 1]
+                ].tobytes()
+                if name == encoded_names[i]:
+                    staxids[i] = self.staxids[position]
+                    break
+                position += 1
+        return staxids
+
+
+# Define function to resolve the staxids of taxonomy paths (strings of lowercased
+# names from the highest to the lowest rank, divided by sep) in bulk: a path gets
+# the staxid of its lowest rank that is found (0 = none). Many paths are shared,
+# so distinct paths are resolved once and broadcast back, and they're resolved
+# through a trie of their prefixes, so that each distinct ancestor is only
+# resolved once: a prefix gets the staxid of its last name, or of its parent
+# prefix if that name isn't found. Each distinct name is looked up once
+def resolve_paths(index, paths, sep=";"):
+    path_ids = {}
+    path_codes = [path_ids.setdefault(path, len(path_ids)) for path in paths]
+    split_paths = [path.split(sep) for path in path_ids]
+    names = list({name for path in split_paths for name in path})
+    name2staxid = dict(zip(names, index.lookup(names).tolist()))
+    trie = {}
+    path_staxids = []
+    for path in split_paths:
+        node, staxid = trie, 0
+        for name in path:
+            if name not in node:
+                node[name] = (name2staxid[name] or staxid, {})
+            staxid, node = node[name]
+        path_staxids.append(staxid)
+    return [path_staxids[code] for code in path_codes]
+
+
+# Define arguments
+parser = argparse.ArgumentParser(
+    description="Build a compact index of NCBI taxonomy names to staxids."
+)
+parser.add_argument("-d", "--names_dmp", help="Path to NCBI's names.dmp.")
+parser.add_argument(
+    "-s", "--scientific", help="Path to NCBI_staxids_scientific.txt (instead of -d)."
+)
+parser.add_argument(
+    "-n",
+    "--non_scientific",
+    help="Path to NCBI_staxids_non_scientific.txt (instead of -d).",
+)
+parser.add_argument(
+    "-o", "--out", required=True, help="Name of the index directory to write."
+)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    time_print("Reading in names...")
+    if args.names_dmp:
+        name2staxid = read_names_dmp(args.names_dmp)
+    elif args.scientific and args.non_scientific:
+        name2staxid = read_name_tables(args.scientific, args.non_scientific)
+    else:
+        parser.error("either -d or -s and -n must be set")
+    time_print("Writing index...")
+    write_index(args.out, name2staxid)
+    time_print("Index done.")
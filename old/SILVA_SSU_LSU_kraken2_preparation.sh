@@ -82,34 +82,25 @@ tax_slv_df1.loc[-1] = ['root;', '1', 'no rank', 'NaN', 'NaN']  # adding a row
 tax_slv_df1.index = tax_slv_df1.index + 1  # shifting index
 tax_slv_df1.sort_index(inplace=True)
 
-## Make dictionary with the taxonomy paths and IDs
-tax_slv_dic1={}
-for index, row in tax_slv_df1.iterrows():
-	tax_slv_dic1[row[0]]=row[1]
-
-## Generate parent paths
-tax_slv_df2=tax_slv_df1.copy() ### Make a copy of df1
-### And remove the last rank in the paths to generate parent paths for parent
-### IDs:
-for index, row in tax_slv_df2.iterrows():
-	row[0]=re.sub('[^;]*;$', '', row[0])
-
-## Make list with parent paths
-tax_slv_list=[]
-for index, row in tax_slv_df2.iterrows():
-	tax_slv_list.append(row[0])
-
-## Make a parent ID list by matching parent paths with original IDs in dic1
-parent_id_list=[]
-for idx, item in enumerate(tax_slv_list):
-	if item == '': # If parent path empty = no parent, insert ID 1, which stands for root
-		parent_id_list.append('1')
-	else:
-		if tax_slv_list[idx] in tax_slv_dic1: # If parent is in the tax file, add its ID to the parent ID list
-			parent_id_list.append(tax_slv_dic1[tax_slv_list[idx]])
-		else: # Else: check the previous parent (had to be done because in once incident a parent was not in the tax file)
-			parent_path_minus_one=re.sub('[^;]*;$', '', tax_slv_list[idx])
-			parent_id_list.append(tax_slv_dic1[parent_path_minus_one])
+## Generate parent paths by removing the last rank of the paths, e.g.
+## "Bacteria;Firmicutes;" -> "Bacteria;" (domains have the empty parent path)
+def parent_paths(paths):
+	split_paths=paths.str[:-1].str.rsplit(';', n=1)
+	return (split_paths.str[0] + ';').where(split_paths.str.len() == 2, '')
+
+## Make dictionary with the taxonomy paths and IDs, the empty parent path (= no
+## parent) gets ID 1, which stands for root
+tax_slv_dic1=dict(zip(tax_slv_df1[0], tax_slv_df1[1].astype(str)))
+tax_slv_dic1['']='1'
+
+## Make a parent ID list by matching all parent paths with the IDs in dic1 at
+## once. If a parent is not in the tax file, the previous parent is used (had to
+## be done because in once incident a parent was not in the tax file)
+tax_slv_parents=parent_paths(tax_slv_df1[0])
+parent_id_list=tax_slv_parents.map(tax_slv_dic1)
+missing_parents=parent_id_list.isna()
+parent_id_list[missing_parents]=parent_paths(tax_slv_parents[missing_parents]) \
+.map(tax_slv_dic1)
 
 ## Columns have to be separated by "\t|\t" or "\t-\t", which doesn't work as delimiter, so
 ## we generate a spacer vector made of "|" and "-" and a spacer for the last
@@ -131,8 +122,8 @@ header=False)
 # Make names_SILVA_SSU_LSU.dmp
 
 tax_slv_df3=tax_slv_df1.copy() # Make a copy of df1
-# Remove the last ";"" and the first taxon in the taxonomy path:
-tax_slv_df3[0]=tax_slv_df3[0].str.replace(r';$', '').str.replace(r'^.*;', '')
+# Keep only the last taxon of the taxonomy path:
+tax_slv_df3[0]=tax_slv_df3[0].str[:-1].str.rsplit(';', n=1).str[-1]
 
 ## Generate the final dataframe
 names_SILVA_SSU_LSU_df=pd.DataFrame({'taxon':tax_slv_df3[1], 'spacer1':spacer1, \
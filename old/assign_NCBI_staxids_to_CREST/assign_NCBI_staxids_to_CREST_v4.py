@@ -6,35 +6,29 @@
 # SILVA_SSU_LSU_makeblastdb_preparation.
 
 # Usage: ./assign_NCBI_staxids_to_CREST.py NCBI_staxids_scientific.txt NCBI_staxids_non_scientific.txt CREST_file output_file_name
+# or:    ./assign_NCBI_staxids_to_CREST.py NCBI_name_index CREST_file output_file_name
 
+# NCBI_name_index is made once with name_index.py (from the root of this
+# repository) from names.dmp or the NCBI staxids files, and makes the script
+# start near-instantly:
+# name_index.py -d names.dmp -o NCBI_name_index
 
-import csv,sys,re,pandas as pd
 
-# Set variable names:
-NCBI_scientific_input=sys.argv[1]
-NCBI_non_scientific_input=sys.argv[2]
-CREST_input=sys.argv[3]
-output_name=sys.argv[4]
+import csv,sys,os,re,pandas as pd
 
-# Read in NCBI scientific names file as dictionary:
-NCBI_scientific = open(NCBI_scientific_input,'r')
-# Setsall file content to lowercase, so that matching of the files later is
-# not depending on upper- or lowercase):
-NCBI_scientific_lower = (line.lower() for line in NCBI_scientific)
-reader1=csv.reader(NCBI_scientific_lower, delimiter='\t')
-NCBI_scientific_dict={}
-for row in reader1:
-	NCBI_scientific_dict[row[0]]=row[1]
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','..'))
+from name_index import NameIndex,read_name_tables,resolve_paths
 
-# Read in NCBI non-scientific names file as dictionary:
-NCBI_non_scientific = open(NCBI_non_scientific_input,'r')
-# Set all file content to lowercase, so that matching of the files later is
-# not depending on upper- or lowercase):
-NCBI_non_scientific_lower = (line.lower() for line in NCBI_non_scientific)
-reader2=csv.reader(NCBI_non_scientific_lower, delimiter='\t')
-NCBI_non_scientific_dict={}
-for row in reader2:
-	NCBI_non_scientific_dict[row[0]]=row[1]
+# Set variable names and load the NCBI names, either from the name index or from
+# the NCBI staxids files (scientific names are matched first):
+if len(sys.argv) == 4:
+	NCBI_index=NameIndex(sys.argv[1])
+	CREST_input=sys.argv[2]
+	output_name=sys.argv[3]
+else:
+	NCBI_index=NameIndex.from_names(read_name_tables(sys.argv[1],sys.argv[2]))
+	CREST_input=sys.argv[3]
+	output_name=sys.argv[4]
 
 # Read in CREST file as dictionary:
 CREST_modified = open(CREST_input,'r')
@@ -50,32 +44,19 @@ for key,value in CREST_lower_dict.items()}
 CREST_lower_no_mt_chl_dict = {key: re.sub("\ \(chloroplast\)", "", value) \
 for key,value in CREST_lower_no_mt_dict.items()}
 
-# Split up CREST taxonomy and invert it
-CREST_lower_no_mt_chl_dict_split_inverted={}
-for key,value in CREST_lower_no_mt_chl_dict.items():
-	CREST_lower_no_mt_chl_dict_split_inverted[key] = value.split(";")[::-1]
+# Split up CREST taxonomy, skipping ranks that contain exceptions (they're not
+# part of the NCBI names):
+exceptions=["environmental", "uncultured", "unidentified", "metagenome"]
+CREST_paths=[";".join(rank for rank in value.split(";") \
+if not any(word in exceptions for word in rank.split(" "))) \
+for value in CREST_lower_no_mt_chl_dict.values()]
 
-# Loop CREST taxonomy dictionary over NCBI taxonomy dictionary for each line and
-# match with NCBI staxid when a hit is found:
+# Match all CREST taxonomy paths against the NCBI names at once, each path gets
+# the NCBI staxid of its lowest rank that has a match, or 0:
+CREST_staxids=resolve_paths(NCBI_index, CREST_paths)
 output_dict={} # Make empty dictionary for matching lines
-# When exception are found in SILVA taxonomy, the respective rank is skipped:
-exceptions=["environmental", "uncultured", "unidentified", "metagenome"]
-for key,value in CREST_lower_no_mt_chl_dict_split_inverted.items():
-	l=0
-	while l < len(value):
-                for exception in value[l].split(" "):
-                        if exception in exceptions:
-                                l += 1
-                                continue
-                if value[l] in NCBI_scientific_dict:
-                        output_dict[key]=NCBI_scientific_dict[value[l]]
-                        break
-                elif value[l] in NCBI_non_scientific_dict:
-                        output_dict[key]=NCBI_non_scientific_dict[value[l]]
-                        break
-                else:
-                        output_dict[key]='0'
-                        l += 1
+for key,staxid in zip(CREST_lower_no_mt_chl_dict.keys(),CREST_staxids):
+	output_dict[key]=str(staxid)
 
 # Convert dictionaries into pandas dataframes and merge them on the CREST OTU columns:
 CREST_df = pd.DataFrame(list(CREST_dict.items()), columns=['OTU','classification']).iloc[0:]
@@ -1,4 +1,4 @@
-#!/usr/bin/python
+#!/usr/bin/python3
 
 # Version 0.2, made on 7rd Apr 2020 by Chris Hempel (hempelc@uoguelph.ca)
 
@@ -8,6 +8,11 @@
 
 
 # Usage: ./assign_NCBI_staxids_to_SILVA_taxonomy_v2.py NCBI_staxids_scientific_file NCBI_staxids_non_scientific_file SILVA_taxonomy_file output_file_name
+# or:    ./assign_NCBI_staxids_to_SILVA_taxonomy_v2.py NCBI_name_index SILVA_taxonomy_file output_file_name
+
+# NCBI_name_index is made once with name_index.py (from the root of this repository)
+# from names.dmp or the NCBI staxids files, and makes the script start near-instantly
+	# name_index.py -d names.dmp -o NCBI_name_index
 
 # Merges SILVA taxonomy paths with NCBI staxids
 
@@ -46,29 +51,21 @@
 		# If SILVA taxonomy is not in exact scientific names, then we match against these to check for synonyms etc.
 
 
-import csv,sys
-
-# Set variable names
-NCBI_scientific_input=sys.argv[1]
-NCBI_non_scientific_input=sys.argv[2]
-SILVA_input=sys.argv[3]
-output_name=sys.argv[4]
+import csv,sys,os
 
-# Read in NCBI scientific names file as dictionary
-NCBI_scientific = open(NCBI_scientific_input,'r')
-NCBI_scientific_lower = (line.lower() for line in NCBI_scientific) # Sets all file content to lowercase, so that matching of the files later is not depending on upper- or lowercase)
-reader1=csv.reader(NCBI_scientific_lower, delimiter='\t')
-NCBI_scientific_dict={}
-for row in reader1:
-	NCBI_scientific_dict[row[0]]=row[1]
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','..'))
+from name_index import NameIndex,read_name_tables,resolve_paths
 
-# Read in NCBI non-scientific names file as dictionary
-NCBI_non_scientific = open(NCBI_non_scientific_input,'r')
-NCBI_non_scientific_lower = (line.lower() for line in NCBI_non_scientific) # Sets all file content to lowercase, so that matching of the files later is not depending on upper- or lowercase)
-reader2=csv.reader(NCBI_non_scientific_lower, delimiter='\t')
-NCBI_non_scientific_dict={}
-for row in reader2:
-	NCBI_non_scientific_dict[row[0]]=row[1]
+# Set variable names and load the NCBI names, either from the name index or from
+# the NCBI staxids files (scientific names are matched first)
+if len(sys.argv) == 4:
+	NCBI_index=NameIndex(sys.argv[1])
+	SILVA_input=sys.argv[2]
+	output_name=sys.argv[3]
+else:
+	NCBI_index=NameIndex.from_names(read_name_tables(sys.argv[1],sys.argv[2]))
+	SILVA_input=sys.argv[3]
+	output_name=sys.argv[4]
 
 # Read in SILVA file as dictionary
 SILVA = open(SILVA_input,'r')
@@ -78,24 +75,13 @@ SILVA_dict={}
 for row in reader3:
 	SILVA_dict[row[0]]=row[1]
 
-# Split up SILVA taxonomy and invert it
-for key,value in SILVA_dict.items():
-	SILVA_dict[key] = value.split(";")[::-1]
-
-# Loop SILVA taxonomy dictionary over NCBI taxonomy dictionary for each line and match with NCBI staxid when a hit is found
+# Match all SILVA taxonomy paths against the NCBI names at once, each path gets the
+# NCBI staxid of its lowest rank that has a match, or 0 (each distinct path is only
+# matched once, as many accessions share the same path)
+SILVA_staxids=resolve_paths(NCBI_index,SILVA_dict.values())
 output_dict={} # Make empty dictionary for matching lines
-for key,value in SILVA_dict.items():
-	l=0
-	while l < len(value):
-		if value[l] in NCBI_scientific_dict:
-			output_dict[key.upper()]=NCBI_scientific_dict[value[l]]
-			break
-		elif value[l] in NCBI_non_scientific_dict:
-			output_dict[key.upper()]=NCBI_non_scientific_dict[value[l]]
-			break
-		else:
-			output_dict[key.upper()]='0'
-			l += 1
+for key,staxid in zip(SILVA_dict.keys(),SILVA_staxids):
+	output_dict[key.upper()]=str(staxid)
 
 # Saves the merged dictionary in a defined output file, delimited by tab
 with open(output_name, 'w') as f:
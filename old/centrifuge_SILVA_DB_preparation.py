@@ -1,10 +1,16 @@
-#!/usr/bin/python
+#!/usr/bin/python3
 
-# Usage: ./centrifuge_SILVA_DB_preparation.py tax_input taxmap_input taxonomy_tree_outname name_table_outname conversion_table_outname
+# Usage: ./centrifuge_SILVA_DB_preparation.py tax_input taxmap_input taxonomy_tree_outname name_table_outname conversion_table_outname [taxonomy_index_outdir]
 # Prepares files for centrifuge SILVA DB generation
 
+# The files are written line by line straight from the input files. If
+# taxonomy_index_outdir is given, the taxonomy is also saved as compact binary
+# taxonomy index, which can be loaded with taxonomy_index.py (from the root of
+# this repository) by other tools, e.g. to assign taxonomy to hits with SILVA
+# taxids
 
-import sys,re,pandas as pd, numpy as np
+
+import sys,os
 
 # Set variable names
 tax_slv_file=sys.argv[1]
@@ -12,83 +18,68 @@ taxmap_slv_file=sys.argv[2]
 taxonomy_tree_out=sys.argv[3]
 name_table_out=sys.argv[4]
 conversion_table_out=sys.argv[5]
+taxonomy_index_out=sys.argv[6] if len(sys.argv) > 6 else None
 
 # Make taxonomy_tree
-##Read in file
-tax_slv_df1=pd.read_csv(tax_slv_file, sep='\t', header=None)
-
-## Adding a row with root as forst line, othrwise we can't make the conversion
-## table as there is no parent ID for domains
-tax_slv_df1.loc[-1] = ['root;', '1', 'no rank', 'NaN', 'NaN']  # adding a row
-tax_slv_df1.index = tax_slv_df1.index + 1  # shifting index
-tax_slv_df1.sort_index(inplace=True)
-
-## Make dictionary with the taxonomy paths and IDs
-tax_slv_dic1={}
-for index, row in tax_slv_df1.iterrows():
-	tax_slv_dic1[row[0]]=row[1]
-
-## Generate parent paths
-tax_slv_df2=tax_slv_df1.copy() # Make a copy of df1
-for index, row in tax_slv_df2.iterrows(): # And remove the last rank in the paths to generate parent paths for parent IDs
-	row[0]=re.sub('[^;]*;$', '', row[0])
-
-## Make list with parent paths
-tax_slv_list=[]
-for index, row in tax_slv_df2.iterrows():
-	tax_slv_list.append(row[0])
-
-## Make a parent ID list by matching parent paths with original IDs in dic1
+## Read in file, with a root as first line, otherwise we can't make the
+## conversion table as there is no parent ID for domains
+tax_slv_paths=['root;']
+tax_slv_ids=['1']
+tax_slv_ranks=['no rank']
+with open(tax_slv_file) as tax_slv:
+	for line in tax_slv:
+		if line.strip():
+			fields=line.rstrip('\n').split('\t')
+			tax_slv_paths.append(fields[0])
+			tax_slv_ids.append(fields[1])
+			tax_slv_ranks.append(fields[2])
+
+## Generate parent paths by removing the last rank of the paths, e.g.
+## "Bacteria;Firmicutes;" -> "Bacteria;" (domains have the empty parent path)
+def parent_path(path):
+	split_path=path[:-1].rsplit(';', 1)
+	return split_path[0] + ';' if len(split_path) == 2 else ''
+
+## Make dictionary with the taxonomy paths and IDs, the empty parent path (= no
+## parent) gets ID 1, which stands for root
+tax_slv_dic1=dict(zip(tax_slv_paths, tax_slv_ids))
+tax_slv_dic1['']='1'
+
+## Make a parent ID list by matching parent paths with the IDs in dic1. If a
+## parent is not in the tax file, the previous parent is used (had to be done
+## because in once incident a parent was not in the tax file)
 parent_id_list=[]
-for idx, item in enumerate(tax_slv_list):
-	if item == '': # If parent path empty = no parent, insert ID 1, which stands for root
-		parent_id_list.append('1')
-	else:
-		if tax_slv_list[idx] in tax_slv_dic1:
-			parent_id_list.append(tax_slv_dic1[tax_slv_list[idx]])
-		else:
-			parent_path_minus_one=re.sub('[^;]*;$', '', tax_slv_list[idx])
-			parent_id_list.append(tax_slv_dic1[parent_path_minus_one])
-
-
-## Columns have to be separated by "\t|\t", which doesn't work as delimiter, so
-## we generate a spacer vector made of "|"
-spacer=np.repeat("|", len(tax_slv_df1), axis=0)
-
-## Generate the final dataframe
-taxonomy_tree_df=pd.DataFrame({'tax_id':tax_slv_df1[1], 'spacer1':spacer, \
-'parent_tax_id':parent_id_list, 'spacer2':spacer, 'rank':tax_slv_df1[2]})
-
-## Write df
-taxonomy_tree_df.to_csv(taxonomy_tree_out, sep='\t', na_rep='NA', index=False, \
-header=False)
-
-
-# Make name_table
-##Read in file
-taxmap_slv_df=pd.read_csv(taxmap_slv_file, sep='\t')
-
-## Make some vectors to match the final output format
-spacer=np.repeat("|", len(taxmap_slv_df), axis=0)
-unique_name=np.repeat("", len(taxmap_slv_df), axis=0)
-name_class=np.repeat("scientific name", len(taxmap_slv_df), axis=0)
-
-## Generate the final dataframe
-name_table_df=pd.DataFrame({'tax_id':taxmap_slv_df['taxid'], 'spacer1':spacer, \
-'name_txt':taxmap_slv_df['organism_name'], 'spacer2':spacer, \
-'unique_name':unique_name, 'spacer3':spacer, 'name_class': name_class, \
-'spacer4': spacer})
-
-## Write df
-name_table_df.to_csv(name_table_out, sep='\t', na_rep='NA', index=False, \
-header=False)
-
-
-# Make conversion_table
-## Generate the final dataframe
-conversion_table_df=pd.DataFrame({'accession number':taxmap_slv_df['primaryAccession'], \
-'tax_id':taxmap_slv_df['taxid']})
-
-## Write df
-conversion_table_df.to_csv(conversion_table_out, sep='\t', na_rep='NA', \
-index=False, header=False)
+for path in tax_slv_paths:
+	parent=parent_path(path)
+	if parent not in tax_slv_dic1:
+		parent=parent_path(parent)
+	parent_id_list.append(tax_slv_dic1.get(parent, 'NA'))
+
+## Write file, columns are separated by "\t|\t"
+with open(taxonomy_tree_out, 'w') as taxonomy_tree:
+	for taxid, parent_id, rank in zip(tax_slv_ids, parent_id_list, tax_slv_ranks):
+		taxonomy_tree.write(f"{taxid}\t|\t{parent_id}\t|\t{rank}\n")
+
+
+# Make name_table and conversion_table in one pass over the taxmap file
+with open(taxmap_slv_file) as taxmap_slv, open(name_table_out, 'w') as name_table, \
+open(conversion_table_out, 'w') as conversion_table:
+	header=next(taxmap_slv).rstrip('\n').split('\t')
+	accession_column=header.index('primaryAccession')
+	name_column=header.index('organism_name')
+	taxid_column=header.index('taxid')
+	for line in taxmap_slv:
+		if line.strip():
+			fields=line.rstrip('\n').split('\t')
+			name_table.write(f"{fields[taxid_column]}\t|\t{fields[name_column] or 'NA'}"
+			"\t|\t\t|\tscientific name\t|\n")
+			conversion_table.write(f"{fields[accession_column]}\t{fields[taxid_column]}\n")
+
+
+# Make binary taxonomy index, names are the last rank of the taxonomy paths
+if taxonomy_index_out:
+	sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+	from taxonomy_index import write_index
+	write_index(taxonomy_index_out, [int(taxid) for taxid in tax_slv_ids],
+	[int(parent_id) if parent_id != 'NA' else 1 for parent_id in parent_id_list],
+	[path[:-1].rsplit(';', 1)[-1] for path in tax_slv_paths], tax_slv_ranks)
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+
+"""
+A script to filter BLAST hits with taxonomy assigned by
+assign_taxonomy_to_NCBI_staxids.sh (without header) so that each sequence gets
+assigned to one taxonomy, as used by blast_filtering.bash.
+
+soft: keeps the best hit (highest bitscore) for each sequence and applies an LCA
+approach if several hits share the best bitscore.
+strict: keeps hits with an alignment length >= 100 and a bitscore >= the bitscore
+threshold and within a percentage of the best bitscore of each sequence, sets
+ranks to "NA" based on the hits' pident and similarity cutoffs, and applies an
+LCA approach.
+cutoff: only sets ranks to "NA" based on the hits' pident and similarity cutoffs,
+and writes the hits with all columns in input order (the similarity cutoff stage
+of blast_filtering.bash).
+lca: only applies the LCA approach with the species rule of strict to hits
+grouped by sequence, and writes one row per sequence in input order (the LCA
+stage of blast_filtering.bash).
+bitscore: only keeps hits with an alignment length >= 100 and a bitscore >= the
+bitscore threshold and within a percentage of the best bitscore of each sequence,
+and writes them with all columns in input order (the bitscore filter stage of
+blast_filtering.bash).
+
+The file is read in a single pass in chunks of complete sequences, so runtime is
+linear in the number of hits. Hits need to be grouped by qseqid, as in BLAST
+output, or can be sorted first with --sort (hit_sort.py), which sorts them on
+disk in bounded memory.
+
+By Chris Hempel (christopher.hempel@kaust.edu.sa) on 18 Oct 2026
+"""
+
+import os
+import time
+import csv
+import argparse
+import itertools
+import pandas as pd
+from blast_filter import cutoff_table, lca_mask, similarity_cutoff, time_print
+from hit_sort import sort_hits
+from taxonomy_index import taxonomic_levels
+
+# Define the columns of files with taxonomy assigned by
+# assign_taxonomy_to_NCBI_staxids.sh
+blast_columns = [
+    "qseqid",
+    "sseqid",
+    "pident",
+    "length",
+    "mismatch",
+    "gapopen",
+    "qstart",
+    "qend",
+    "sstart",
+    "send",
+    "evalue",
+    "bitscore",
+    "staxid",
+]
+annotated_columns = blast_columns + ["lowest_rank", "lowest_hit"] + taxonomic_levels
+
+# Define the ranks the LCA is performed on, the lowest hit is output as species
+lca_ranks = ["lowest_hit"] + taxonomic_levels
+output_columns = ["sequence_name"] + taxonomic_levels + ["species"]
+
+# Define the ranks that are set to "NA" if a hit's pident is below the respective
+# similarity cutoff, in the order of the cutoffs (species, genus, family, order,
+# class, phylum)
+cutoff_ranks = [
+    ["lowest_hit"],
+    ["genus"],
+    ["family"],
+    ["order", "suborder", "infraorder"],
+    ["class", "subclass"],
+    ["phylum", "subphylum"],
+]
+
+# Define the format species names need to have to be kept: soft requires "Genus
+# species", i.e. two words with a capitalized first word and a non-capitalized
+# second word (or a "-"), strict only a capitalized first letter
+species_patterns = {"soft": r"[A-Z][^ ]* [a-z-]", "strict": r"[A-Z]"}
+
+
+# Define function to turn chunks of hits into chunks that only contain complete
+# sequences. Hits are grouped by qseqid, so the trailing sequence of each chunk
+# is carried over to the next chunk, as it might continue there
+def group_chunks(chunks):
+    carry = None
+    for chunk in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk])
+        if chunk.empty:
+            continue
+        last_group = chunk["qseqid"] == chunk["qseqid"].iloc[-1]
+        carry = chunk[last_group]
+        yield chunk[~last_group]
+    if carry is not None:
+        yield carry
+
+
+# Define function to read in the annotated hits in chunks of complete sequences
+def read_annotated_groups(file, chunksize):
+    chunks = pd.read_csv(
+        file,
+        sep="\t",
+        header=None,
+        names=annotated_columns,
+        usecols=["qseqid", "pident", "length", "bitscore"] + lca_ranks,
+        dtype=str,
+        keep_default_na=False,
+        quoting=csv.QUOTE_NONE,
+        chunksize=chunksize,
+    )
+    return group_chunks(
+        chunk.astype({"pident": float, "length": float, "bitscore": float})
+        for chunk in chunks
+    )
+
+
+# Define function to apply the bitscore threshold and the bitscore filter to the
+# annotated hits grouped by qseqid, sequence by sequence, and write the kept hits
+# with all columns in input order
+def write_bitscore_hits(file, out, bitscore, percentage):
+    qseqid_column, length_column, bitscore_column = (
+        annotated_columns.index(column) for column in ["qseqid", "length", "bitscore"]
+    )
+    n_hits = 0
+    with open(file) as hits, open(out, "w") as out_file:
+        rows = (line.rstrip("\n").split("\t") for line in hits if line.strip())
+        for _, group in itertools.groupby(rows, key=lambda row: row[qseqid_column]):
+            group = list(group)
+            n_hits += len(group)
+            group = [
+                row
+                for row in group
+                if float(row[length_column]) >= 100
+                and float(row[bitscore_column]) >= bitscore
+            ]
+            if not group:
+                continue
+            max_bitscore = max(float(row[bitscore_column]) for row in group)
+            out_file.writelines(
+                "\t".join(row) + "\n"
+                for row in group
+                if float(row[bitscore_column]) >= max_bitscore - max_bitscore * percentage
+            )
+    return n_hits
+
+
+# Define function to apply the similarity cutoff to the annotated hits line by
+# line and write them with all columns in input order. The rank columns are
+# checked from the highest cutoff down, so that each hit stops at the first
+# cutoff its pident passes
+def write_cutoff_hits(file, out, cutoffs):
+    rank_columns = sorted(
+        (
+            (annotated_columns.index(rank), cutoff)
+            for rank, cutoff in cutoff_table(cutoffs, cutoff_ranks).items()
+        ),
+        key=lambda rank_column: rank_column[1],
+        reverse=True,
+    )
+    pident_column = annotated_columns.index("pident")
+    n_hits = 0
+    with open(file) as hits, open(out, "w") as out_file:
+        for line in hits:
+            n_hits += 1
+            fields = line.rstrip("\n").split("\t")
+            pident = float(fields[pident_column])
+            for column, cutoff in rank_columns:
+                if pident >= cutoff:
+                    break
+                fields[column] = "NA"
+            out_file.write("\t".join(fields) + "\n")
+    return n_hits
+
+
+# Define function to keep only the hits with the best bitscore of each sequence
+def best_hits(df):
+    return df[df.groupby("qseqid")["bitscore"].transform("max") == df["bitscore"]]
+
+
+# Define function to remove all hits that are below alignment length 100 (based
+# on BASTA) and the bitscore threshold (default 155 based on CREST)
+def bitscore_threshold(df, bitscore):
+    return df[(df["length"] >= 100) & (df["bitscore"] >= bitscore)]
+
+
+# Define function to keep only the hits within a percentage of the best bitscore
+# of each sequence
+def bitscore_filter(df, percentage):
+    max_bitscore = df.groupby("qseqid")["bitscore"].transform("max")
+    return df[df["bitscore"] >= max_bitscore - max_bitscore * percentage]
+
+
+# Define function to cut taxa down to their first two words (essentially just
+# relevant for rank "species", if more than two, e.g. subspecies info, we just
+# want genus and species). Each distinct taxon is only cut once
+def first_two_words(taxa):
+    codes, unique_taxa = pd.factorize(taxa)
+    cut_taxa = pd.Index(unique_taxa).str.split(" ").str[:2].str.join(" ")
+    return pd.Series(cut_taxa[codes], index=taxa.index)
+
+
+# Define function to keep species names only if they're in the format of the
+# filter mode, everything else (e.g. "uncultured bacterium") is "NA"
+def valid_species(species, filter_mode="soft"):
+    return species.where(species.str.match(species_patterns[filter_mode]), "NA")
+
+
+# Define function to apply the LCA approach: ranks are kept if they're identical
+# in all hits of a sequence, otherwise they're "NA", and one row per sequence is
+# returned with columns in the output order
+def lca(df, filter_mode="soft"):
+    df_tax = df[["qseqid"]].assign(
+        **{rank: first_two_words(df[rank]) for rank in lca_ranks}
+    )
+    df_tax = df_tax.mask(lca_mask(df_tax, lca_ranks), "NA")
+    df_tax["qseqid"] = df["qseqid"]
+    df_tax = df_tax.drop_duplicates("qseqid")
+    df_tax["lowest_hit"] = valid_species(df_tax["lowest_hit"], filter_mode)
+    return df_tax.rename(
+        columns={"qseqid": "sequence_name", "lowest_hit": "species"}
+    )[output_columns]
+
+
+# Define function to filter a chunk of complete sequences
+def filter_taxonomy(df, filter_mode, bitscore=155, percentage=0.02, cutoffs=None):
+    if filter_mode == "soft":
+        return lca(best_hits(df))
+    df = bitscore_filter(bitscore_threshold(df, bitscore), percentage)
+    if cutoffs:
+        df = similarity_cutoff(df, cutoff_table(cutoffs, cutoff_ranks))
+    return lca(df, filter_mode)
+
+
+# Define function to apply the LCA approach with the strict species rule to hits
+# grouped by qseqid (e.g. after the similarity cutoff) chunk of complete
+# sequences by chunk, and write one row per sequence in input order
+def write_lca(file, out, chunksize):
+    n_hits = 0
+    with open(out, "w") as out_file:
+        out_file.write("\t".join(output_columns) + "\n")
+        for df in read_annotated_groups(file, chunksize):
+            n_hits += len(df)
+            lca(df, "strict").to_csv(
+                out_file, sep="\t", header=False, index=False, quoting=csv.QUOTE_NONE
+            )
+    return n_hits
+
+
+# Define function to sort the filtered sequences by name and save them
+def write_filtered(filtered, out):
+    if filtered:
+        df = pd.concat(filtered).sort_values("sequence_name", kind="stable")
+    else:
+        df = pd.DataFrame(columns=output_columns)
+    df.to_csv(out, sep="\t", index=False, quoting=csv.QUOTE_NONE)
+    return df
+
+
+# Define arguments
+parser = argparse.ArgumentParser(
+    description=(
+        "Filter BLAST hits with taxonomy assigned by "
+        "assign_taxonomy_to_NCBI_staxids.sh (without header)."
+    )
+)
+parser.add_argument(
+    "filter_mode",
+    choices=["soft", "strict", "bitscore", "cutoff", "lca"],
+    help=(
+        "Mode of filtering. soft: keeps the best hit (highest bitscore) for each "
+        "sequence. If multiple hits have the same highest bitscore, an LCA approach "
+        "is applied. strict: bitscore filtering, similarity cutoff and LCA approach, "
+        "see -b, -p and -c. bitscore: only applies the bitscore filtering (-b and "
+        "-p) and writes the kept hits with all columns in input order. cutoff: only applies the similarity cutoff (-c) and "
+        "writes all hits with all columns in input order. lca: only applies the "
+        "LCA approach (with the species rule of strict) and writes one row per "
+        "sequence in input order."
+    ),
+)
+parser.add_argument(
+    "-i",
+    "--input",
+    required=True,
+    help="Input file, hits grouped by qseqid (or see --sort).",
+)
+parser.add_argument("-o", "--out", required=True, help="Name of output file.")
+parser.add_argument(
+    "-b",
+    "--bitscore",
+    default=155,
+    type=float,
+    help="Bitscore threshold for strict (default=155).",
+)
+parser.add_argument(
+    "-p",
+    "--percentage",
+    default=0.02,
+    type=float,
+    help=(
+        "Hits within this percentage of the best bitscore of each sequence are kept "
+        "for strict (default=0.02)."
+    ),
+)
+parser.add_argument(
+    "-c",
+    "--cutoff",
+    default=[99, 97, 95, 90, 85, 80],
+    type=float,
+    nargs=6,
+    help=(
+        "Similarity cutoffs for the ranks species, genus, family, order, class, "
+        "phylum for strict (default=99 97 95 90 85 80)."
+    ),
+)
+parser.add_argument(
+    "-n",
+    "--chunksize",
+    default=1000000,
+    type=int,
+    help="Number of lines read in per chunk (default=1000000).",
+)
+parser.add_argument(
+    "-s",
+    "--sort",
+    action="store_true",
+    help=(
+        "Sort the input by qseqid and bitscore first, on disk in bounded memory "
+        "(-n lines at once), for input files that are not grouped by qseqid."
+    ),
+)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    # Sort hits by qseqid and bitscore into a temporary file next to the output
+    if args.sort:
+        time_print("Sorting hits...")
+        sorted_input = args.out + ".sorted.tmp"
+        sort_hits(args.input, sorted_input, max_lines=args.chunksize)
+        args.input = sorted_input
+
+    start = time.time()
+    if args.filter_mode in ["bitscore", "cutoff", "lca"]:
+        if args.filter_mode == "bitscore":
+            time_print("Performing bitscore filter...")
+            n_hits = write_bitscore_hits(
+                args.input, args.out, args.bitscore, args.percentage
+            )
+        elif args.filter_mode == "cutoff":
+            time_print("Applying similarity cutoff...")
+            n_hits = write_cutoff_hits(args.input, args.out, args.cutoff)
+        else:
+            time_print("Performing LCA approach...")
+            n_hits = write_lca(args.input, args.out, args.chunksize)
+        time_print(f"Processed {n_hits} hits in {time.time() - start:.1f} s.")
+    else:
+        time_print("Filtering hits...")
+        n_hits = 0
+        filtered = []
+        for df in read_annotated_groups(args.input, args.chunksize):
+            n_hits += len(df)
+            filtered.append(
+                filter_taxonomy(
+                    df, args.filter_mode, args.bitscore, args.percentage, args.cutoff
+                )
+            )
+        seconds = time.time() - start
+
+        # Sort sequences by name and save df
+        df = write_filtered(filtered, args.out)
+
+        time_print(
+            f"Filtered {n_hits} hits of {len(df)} sequences in {seconds:.1f} s "
+            f"({n_hits / max(seconds, 1e-9):.0f} rows/sec)."
+        )
+
+    if args.sort:
+        os.remove(sorted_input)
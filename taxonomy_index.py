@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+
+"""
+A script to build a compact, memory-mapped NCBI taxonomy index and to assign
+taxonomy to BLAST hits with NCBI staxids using that index.
+
+The index is built once from ete3's taxa.sqlite or from NCBI's nodes.dmp and
+names.dmp and replaces the ete3 ncbiquery + LookupTaxonDetails3.py lookups of
+assign_taxonomy_to_NCBI_staxids.sh at runtime. It is a directory of flat arrays
+indexed by taxid (parent, rank code, name offset) and a blob of scientific names,
+which are memory-mapped on load.
+
+By Chris Hempel (christopher.hempel@kaust.edu.sa) on 18 Oct 2026
+"""
+
+import datetime
+import os
+import sqlite3
+import argparse
+import numpy as np
+from urllib.request import pathname2url
+
+# Define the ranks that are written out per hit, same as in LookupTaxonDetails3.py
+taxonomic_levels = [
+    "superkingdom",
+    "kingdom",
+    "phylum",
+    "subphylum",
+    "class",
+    "subclass",
+    "order",
+    "suborder",
+    "infraorder",
+    "family",
+    "genus",
+]
+
+
+# Define funtion to print datetime and text
+def time_print(text):
+    datetime_now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"{datetime_now}  ---  " + text)
+
+
+# Define function to read in taxid, parent taxid, scientific name and rank of all
+# taxa from ete3's taxa.sqlite
+def read_sqlite_taxonomy(sqlite_file):
+    conn = sqlite3.connect(f"file:{pathname2url(sqlite_file)}?mode=ro", uri=True)
+    rows = conn.execute("SELECT taxid, parent, spname, rank FROM species").fetchall()
+    conn.close()
+    taxids, parents, names, ranks = zip(*rows)
+    return list(taxids), list(parents), list(names), list(ranks)
+
+
+# Define function to read in taxid, parent taxid, scientific name and rank of all
+# taxa from NCBI's nodes.dmp and names.dmp
+def read_dmp_taxonomy(nodes_file, names_file):
+    taxids, parents, ranks = [], [], []
+    with open(nodes_file) as nodes:
+        for line in nodes:
+            fields = line.split("\t|\t")
+            taxids.append(int(fields[0]))
+            parents.append(int(fields[1]))
+            ranks.append(fields[2])
+    taxid2name = {}
+    with open(names_file) as names:
+        for line in names:
+            fields = line.rstrip("\t|\n").split("\t|\t")
+            if fields[3] == "scientific name":
+                taxid2name[int(fields[0])] = fields[1]
+    names = [taxid2name.get(taxid, "") for taxid in taxids]
+    return taxids, parents, names, ranks
+
+
+# Define function to make the arrays of the index: arrays are indexed by taxid,
+# rank code 0 marks taxids that don't exist, and the name of taxid t is the slice
+# names_bin[name_offset[t]:name_offset[t + 1]]
+def index_arrays(taxids, parents, names, ranks):
+    taxids = np.asarray(taxids, dtype=np.int64)
+    size = taxids.max() + 1
+
+    parent = np.zeros(size, dtype=np.int32)
+    parent[taxids] = parents
+
+    rank_names, rank_codes = np.unique(
+        np.asarray(ranks, dtype=str), return_inverse=True
+    )
+    rank = np.zeros(size, dtype=np.uint8)
+    rank[taxids] = rank_codes + 1
+
+    encoded_names = [name.encode() for name in names]
+    name_length = np.zeros(size, dtype=np.int64)
+    name_length[taxids] = [len(name) for name in encoded_names]
+    name_offset = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(name_length, out=name_offset[1:])
+    ordered_names = [b""] * size
+    for taxid, name in zip(taxids, encoded_names):
+        ordered_names[taxid] = name
+    names_bin = np.frombuffer(b"".join(ordered_names), dtype=np.uint8)
+
+    return parent, rank, name_offset, names_bin, list(rank_names)
+
+
+# Define function to write the index
+def write_index(index_dir, taxids, parents, names, ranks):
+    os.makedirs(index_dir, exist_ok=True)
+    parent, rank, name_offset, names_bin, rank_names = index_arrays(
+        taxids, parents, names, ranks
+    )
+    np.save(os.path.join(index_dir, "parent.npy"), parent)
+    np.save(os.path.join(index_dir, "rank.npy"), rank)
+    np.save(os.path.join(index_dir, "name_offset.npy"), name_offset)
+    with open(os.path.join(index_dir, "names.bin"), "wb") as names_bin_file:
+        names_bin_file.write(names_bin.tobytes())
+    with open(os.path.join(index_dir, "ranks.txt"), "w") as ranks_txt:
+        ranks_txt.write("\n".join(rank_names) + "\n")
+
+
+# Define class to load a taxonomy index and look up names and lineages of taxids.
+# An index can also be built in memory with from_taxonomy, e.g. straight from
+# taxa.sqlite, without writing it to disk first
+class TaxonomyIndex:
+    def __init__(self, index_dir=None):
+        if index_dir is None:
+            return
+        self.parent = np.load(os.path.join(index_dir, "parent.npy"), mmap_mode="r")
+        self.rank = np.load(os.path.join(index_dir, "rank.npy"), mmap_mode="r")
+        self.name_offset = np.load(
+            os.path.join(index_dir, "name_offset.npy"), mmap_mode="r"
+        )
+        names_file = os.path.join(index_dir, "names.bin")
+        if os.path.getsize(names_file):
+            self.names_bin = np.memmap(names_file, dtype=np.uint8, mode="r")
+        else:
+            self.names_bin = np.zeros(0, dtype=np.uint8)
+        with open(os.path.join(index_dir, "ranks.txt")) as ranks_txt:
+            self.rank_names = [""] + ranks_txt.read().splitlines()
+
+    @classmethod
+    def from_taxonomy(cls, taxids, parents, names, ranks):
+        index = cls()
+        index.parent, index.rank, index.name_offset, index.names_bin, rank_names = (
+            index_arrays(taxids, parents, names, ranks)
+        )
+        index.rank_names = [""] + rank_names
+        return index
+
+    # Define method to check which taxids exist in the index
+    def contains(self, taxids):
+        taxids = np.asarray(taxids, dtype=np.int64)
+        in_range = (taxids > 0) & (taxids < len(self.rank))
+        found = np.zeros(len(taxids), dtype=bool)
+        found[in_range] = self.rank[taxids[in_range]] > 0
+        return found
+
+    # Define method to get the scientific names of taxids
+    def names(self, taxids):
+        return [
+            self.names_bin[self.name_offset[taxid] : self.name_offset[taxid + 1]]
+            .tobytes()
+            .decode()
+            for taxid in taxids
+        ]
+
+    # Define method to get the rank names of taxids
+    def ranks(self, taxids):
+        return [self.rank_names[code] for code in self.rank[np.asarray(taxids)]]
+
+    # Define method to get the lineages of existing taxids as a matrix of ancestor
+    # taxids with one column per level (0 = no ancestor at that level). All taxids
+    # are walked up to the root at once, one parent step per iteration; the root
+    # itself is not part of lineages, and if several ancestors share a rank, the
+    # lowest one is kept
+    def lineages(self, taxids, levels):
+        level_of_rank = np.full(len(self.rank_names), -1)
+        for i, level in enumerate(levels):
+            if level in self.rank_names:
+                level_of_rank[self.rank_names.index(level)] = i
+        current = np.asarray(taxids, dtype=np.int64)
+        rows = np.arange(len(current))
+        lineage_taxids = np.zeros((len(current), len(levels)), dtype=np.int64)
+        active = current > 1
+        while active.any():
+            level = level_of_rank[self.rank[current]]
+            found = active & (level >= 0)
+            found[found] = lineage_taxids[rows[found], level[found]] == 0
+            lineage_taxids[rows[found], level[found]] = current[found]
+            current = np.where(active, self.parent[current], current)
+            active = current > 1
+        return lineage_taxids
+
+
+# Define function to look up the taxonomy columns that are appended to hits of
+# each taxid, in the same order as in LookupTaxonDetails3.py (lowest rank, lowest
+# hit, one column per level), as a list per taxid
+def lookup_taxonomy(index, taxid_strings, levels=taxonomic_levels):
+    taxids = np.array(
+        [int(taxid) if taxid.isdigit() else 0 for taxid in taxid_strings],
+        dtype=np.int64,
+    )
+    # The root has no lineage below it, so it is handled like a missing taxid
+    found = index.contains(taxids) & (taxids != 1)
+    found_taxids = taxids[found]
+    lineage_taxids = index.lineages(found_taxids, levels)
+    unique_lineage_taxids = np.unique(lineage_taxids[lineage_taxids > 0])
+    taxid2name = dict(zip(unique_lineage_taxids, index.names(unique_lineage_taxids)))
+    taxid2name[0] = "NA"
+    unknown = ["Unknown"] * (len(levels) + 2)
+    taxonomies = dict.fromkeys(taxid_strings, unknown)
+    found_strings = np.asarray(taxid_strings, dtype=object)[found]
+    for taxid_string, rank, name, lineage in zip(
+        found_strings,
+        index.ranks(found_taxids),
+        index.names(found_taxids),
+        lineage_taxids,
+    ):
+        taxonomies[taxid_string] = [rank, name] + [
+            taxid2name[taxid] for taxid in lineage
+        ]
+    return taxonomies
+
+
+# Define function to format the taxonomy columns that are appended to hits of
+# each taxid, in the same format as LookupTaxonDetails3.py
+def format_taxonomy(index, taxid_strings, levels=taxonomic_levels):
+    return {
+        taxid_string: "\t" + "\t".join(taxonomy)
+        for taxid_string, taxonomy in lookup_taxonomy(
+            index, taxid_strings, levels
+        ).items()
+    }
+
+
+# Define function to assign taxonomy to a BLAST file, chunk by chunk. Taxonomy
+# columns are formatted once per distinct taxid and then reused for all hits
+def annotate_blast(index, blast_file, output_file, taxon_column, chunksize=1000000):
+    suffixes = {}
+    with open(blast_file) as blast, open(output_file, "w", buffering=2**22) as out:
+        while True:
+            lines = [line.rstrip("\n") for _, line in zip(range(chunksize), blast)]
+            if not lines:
+                break
+            taxid_strings = [
+                line.split("\t")[taxon_column - 1].split(";")[0] for line in lines
+            ]
+            new_taxid_strings = set(taxid_strings).difference(suffixes)
+            if new_taxid_strings:
+                suffixes.update(format_taxonomy(index, list(new_taxid_strings)))
+            out.write(
+                "".join(
+                    f"{line}{suffixes[taxid]}\n"
+                    for line, taxid in zip(lines, taxid_strings)
+                )
+            )
+
+
+# Define arguments
+parser = argparse.ArgumentParser(
+    description="Build and use a compact NCBI taxonomy index."
+)
+subparsers = parser.add_subparsers(dest="command", required=True)
+
+parser_build = subparsers.add_parser(
+    "build", help="Build the index from taxa.sqlite or nodes.dmp and names.dmp."
+)
+parser_build.add_argument(
+    "-s", "--sqlite", help="Path to ete3's taxa.sqlite (usually ~/.etetoolkit/)."
+)
+parser_build.add_argument("-n", "--nodes", help="Path to NCBI's nodes.dmp.")
+parser_build.add_argument("-m", "--names", help="Path to NCBI's names.dmp.")
+parser_build.add_argument(
+    "-o", "--out", required=True, help="Name of the index directory to write."
+)
+
+parser_annotate = subparsers.add_parser(
+    "annotate",
+    help=(
+        "Assign taxonomy to a BLAST file including a column with NCBI staxids, "
+        "same as assign_taxonomy_to_NCBI_staxids.sh (without header)."
+    ),
+)
+parser_annotate.add_argument(
+    "-b", "--blast", required=True, help="BLAST file including NCBI staxids."
+)
+parser_annotate.add_argument(
+    "-c",
+    "--column",
+    default=13,
+    type=int,
+    help="Number of the column containing NCBI staxids (default=13).",
+)
+parser_annotate.add_argument(
+    "-x", "--index", required=True, help="Index directory made with build."
+)
+parser_annotate.add_argument(
+    "-o", "--out", required=True, help="Name of output file."
+)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    if args.command == "build":
+        time_print("Reading in taxonomy...")
+        if args.sqlite:
+            taxonomy = read_sqlite_taxonomy(args.sqlite)
+        elif args.nodes and args.names:
+            taxonomy = read_dmp_taxonomy(args.nodes, args.names)
+        else:
+            parser_build.error("either -s or -n and -m must be set")
+        time_print("Writing index...")
+        write_index(args.out, *taxonomy)
+        time_print("Index done.")
+
+    elif args.command == "annotate":
+        time_print("Assigning taxonomy...")
+        annotate_blast(TaxonomyIndex(args.index), args.blast, args.out, args.column)
+        time_print("Assigning taxonomy done.")
@@ -0,0 +1,143 @@
+"""
+Tests of the sharded blastn of blast_filtering.py with a stub blastn
+(tests/stub/blastn) that replays a fixed hit table: output with -s 1 and -s 4
+has to be identical, and if one shard fails, the blastn of the other shards has
+to be stopped and the script has to exit with the error.
+
+Usage: python -m pytest tests/test_blast_filtering_shards.py
+"""
+
+import os
+import sys
+import time
+import subprocess
+import numpy as np
+import pytest
+
+tests = os.path.dirname(os.path.abspath(__file__))
+repo = os.path.join(tests, "..")
+sys.path.insert(0, repo)
+from taxonomy_index import write_index
+
+n_queries = 40
+
+
+# Define fixture of a directory with a query .fasta, a hit table of its queries
+# and a taxonomy index: 5 genera of 4 species each in one superkingdom. The hits
+# of a query are species of one genus
+@pytest.fixture
+def run_dir(tmp_path):
+    rng = np.random.default_rng(1)
+    with open(tmp_path / "query.fasta", "w") as fasta:
+        for i in range(n_queries):
+            fasta.write(f">q{i}\n" + "ACGT" * (10 + 5 * i) + "\n")
+    with open(tmp_path / "hits.txt", "w") as hits:
+        for i in range(n_queries):
+            genus = rng.integers(5)
+            for _ in range(rng.integers(1, 7)):
+                fields = [
+                    f"q{i}",
+                    f"s{rng.integers(1000)}",
+                    f"{rng.uniform(95, 100):.3f}",
+                    str(rng.integers(80, 300)),
+                    "0",
+                    "0",
+                    "1",
+                    "100",
+                    "1",
+                    "100",
+                    "1e-30",
+                    str(rng.choice([150, 160, 200, 203])),
+                    str(100 + genus + 5 * rng.integers(4)),
+                ]
+                hits.write("\t".join(fields) + "\n")
+    taxids = [1, 2] + list(range(10, 15)) + list(range(100, 120))
+    parents = [1, 1] + [2] * 5 + [10 + i % 5 for i in range(20)]
+    names = ["root", "Bacteria"] + [f"G{i}" for i in range(5)]
+    names += [f"G{i % 5} S{i}" for i in range(20)]
+    ranks = ["no rank", "superkingdom"] + ["genus"] * 5 + ["species"] * 20
+    write_index(str(tmp_path / "index"), taxids, parents, names, ranks)
+    return tmp_path
+
+
+# Define function to run blast_filtering.py on the query .fasta with the stub
+# blastn
+def run_blast_filtering(run_dir, filtering, shards, **stub_env):
+    env = dict(os.environ, PATH=os.path.join(tests, "stub") + os.pathsep + os.environ["PATH"])
+    env["STUB_BLASTN_HITS"] = str(run_dir / "hits.txt")
+    env.update(stub_env)
+    return subprocess.run(
+        [
+            sys.executable,
+            os.path.join(repo, "blast_filtering.py"),
+            "-i",
+            "query.fasta",
+            "-f",
+            "fasta",
+            "-t",
+            filtering,
+            "-x",
+            "index",
+            "-d",
+            "db",
+            "-T",
+            "4",
+            "-s",
+            str(shards),
+        ],
+        cwd=run_dir,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+
+
+# Define function to check if a process is running (zombies are not)
+def running(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            return stat.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+@pytest.mark.parametrize(
+    "filtering, suffix",
+    [
+        ("soft", "_with_taxonomy_and_best_hit.txt"),
+        (
+            "strict",
+            "_with_taxonomy_and_bitscore_threshold_and_bitscore_filter_and_pident"
+            "_cutoff_and_LCA.txt",
+        ),
+    ],
+)
+def test_shards_give_same_output(run_dir, filtering, suffix):
+    out = run_dir / "blast_filtering_results" / ("blast_output" + suffix)
+    outputs = []
+    for shards in [1, 4]:
+        result = run_blast_filtering(run_dir, filtering, shards)
+        assert result.returncode == 0, result.stderr
+        outputs.append(out.read_text())
+    assert len(outputs[0].splitlines()) > n_queries // 2
+    assert outputs[0] == outputs[1]
+
+
+def test_failed_shard_stops_other_shards(run_dir):
+    # The two longest queries go into different shards, one shard's blastn
+    # writes a row that can't be parsed while the other one keeps running
+    start = time.time()
+    result = run_blast_filtering(
+        run_dir,
+        "strict",
+        2,
+        STUB_BLASTN_BAD=f"q{n_queries - 2}",
+        STUB_BLASTN_SLOW=f"q{n_queries - 1}",
+        STUB_BLASTN_PIDS=str(run_dir / "pids.txt"),
+    )
+    assert time.time() - start < 30
+    assert result.returncode != 0
+    assert "ValueError" in result.stderr
+    pids = (run_dir / "pids.txt").read_text().split()
+    assert len(pids) == 2
+    assert not any(running(pid) for pid in pids)
@@ -0,0 +1,129 @@
+"""
+Tests of the job scheduler of fastqc_on_R1_R2_and_optional_trimming.sh with
+stub java (Trimmomatic) and fastqc executables (tests/stub): the cores of all
+running jobs never exceed the core budget (-p), FastQC only runs on a trimmed
+set after it was trimmed, and jobs that depend on a failed job are skipped. With
+-q profile, fastq_profile.py only profiles the read sets of finished runs.
+
+Usage: python -m pytest tests/test_fastqc_scheduler.py
+"""
+
+import os
+import subprocess
+import pytest
+
+tests = os.path.dirname(os.path.abspath(__file__))
+repo = os.path.abspath(os.path.join(tests, ".."))
+script = os.path.join(repo, "fastqc_on_R1_R2_and_optional_trimming.sh")
+scores = [5, 10, 15, 20]
+
+
+# Define function to run the script with trimming on all scores in a new
+# directory, returns the jobs' events as (time, start|end, job, cores), sorted by
+# time with ends before starts at the same time. The repository is in PATH for
+# fastq_profile.py
+def run_script(tmp_path, threads, *options, **stub_env):
+    for reads in ["s_R1.fastq", "s_R2.fastq"]:
+        (tmp_path / reads).write_text("@r\nACGT\n+\nIIII\n")
+    env = dict(
+        os.environ,
+        PATH=os.pathsep.join([os.path.join(tests, "stub"), repo, os.environ["PATH"]]),
+    )
+    env.update(STUB_LOG=str(tmp_path / "stub.log"), STUB_SECONDS="0.3", **stub_env)
+    subprocess.run(
+        [
+            "bash",
+            script,
+            "-1",
+            "s_R1.fastq",
+            "-2",
+            "s_R2.fastq",
+            "-t",
+            "yes",
+            "-T",
+            "/opt/trimmomatic/trimmomatic.jar",
+            "-P",
+            " ".join(map(str, scores)),
+            "-p",
+            str(threads),
+            *options,
+        ],
+        cwd=tmp_path,
+        env=env,
+        check=True,
+        capture_output=True,
+    )
+    events = []
+    for line in (tmp_path / "stub.log").read_text().splitlines():
+        time, kind, job, cores = line.split()
+        events.append((float(time), kind, job, int(cores)))
+    return sorted(events, key=lambda event: (event[0], event[1] == "start"))
+
+
+# Define function to get the maximum number of cores in use at once
+def max_cores(events):
+    cores = max_cores = 0
+    for _, kind, _, job_cores in events:
+        cores += job_cores if kind == "start" else -job_cores
+        max_cores = max(max_cores, cores)
+    return max_cores
+
+
+# Define function to get the jobs that ran, as {job: (start, end)}
+def job_times(events):
+    times = {}
+    for time, kind, job, _ in events:
+        times.setdefault(job, [None, None])[kind == "end"] = time
+    return times
+
+
+def trimmed_reads(score, pair):
+    return f"trimmed_at_phred_{score}_s_{pair}.fastq"
+
+
+@pytest.mark.parametrize("threads", [1, 2, 4, 8])
+def test_core_budget(tmp_path, threads):
+    events = run_script(tmp_path, threads)
+    assert max_cores(events) <= threads
+    times = job_times(events)
+    # 4 Trimmomatic runs, FastQC on R1, R2 and 8 trimmed sets
+    assert len(times) == 14
+    for score in scores:
+        for pair in ["1P", "2P"]:
+            assert times[trimmed_reads(score, pair)][0] >= times[f"trimmomatic_phred_{score}"][1]
+
+
+def test_jobs_run_in_parallel(tmp_path):
+    assert max_cores(run_script(tmp_path, 8)) == 8
+
+
+def test_failed_job_skips_dependents(tmp_path):
+    times = job_times(run_script(tmp_path, 4, STUB_FAIL_SCORE="15"))
+    assert "trimmomatic_phred_15" in times
+    assert trimmed_reads(15, "1P") not in times
+    assert trimmed_reads(15, "2P") not in times
+    assert trimmed_reads(20, "1P") in times
+    log = (
+        tmp_path
+        / "fastqc_on_R1_R2_and_optional_trimming_output"
+        / "fastqc_on_R1_R2_and_optional_trimming_log.txt"
+    ).read_text()
+    assert "trimmomatic_phred_15 failed with exit status 3." in log
+    assert "Skipping fastqc_phred_15_1P, as trimmomatic_phred_15 didn't finish." in log
+
+
+def test_profile_skips_failed_runs(tmp_path):
+    times = job_times(run_script(tmp_path, 4, "-q", "profile", STUB_FAIL_SCORE="15"))
+    # Only Trimmomatic runs, no FastQC
+    assert sorted(times) == sorted(f"trimmomatic_phred_{score}" for score in scores)
+    summary = (
+        tmp_path / "fastqc_on_R1_R2_and_optional_trimming_output" / "fastq_profile.tsv"
+    ).read_text()
+    files = [line.split("\t")[0] for line in summary.splitlines()[1:]]
+    assert files[:2] == ["s_R1.fastq", "s_R2.fastq"]
+    assert sorted(os.path.basename(file) for file in files[2:]) == sorted(
+        trimmed_reads(score, pair)
+        for score in scores
+        if score != 15
+        for pair in ["1P", "2P"]
+    )
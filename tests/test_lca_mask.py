@@ -0,0 +1,62 @@
+"""
+Equivalence test of blast_filter.lca_mask against the previous groupby lambda
+LCA mask, on a shuffled synthetic hit table with NaN and "Unknown" ranks and
+single-hit queries.
+
+Usage: python -m pytest tests/test_lca_mask.py
+"""
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from blast_filter import encode_ranks, lca_mask
+
+ranks = ["superkingdom", "phylum", "class", "order", "family", "genus", "species"]
+
+
+# Define function to make a shuffled hit table of n_queries qseqids with 1 to 5
+# hits each. Hits mostly share the taxon of their qseqid, and lower ranks differ
+# more often, so that ranks of qseqids are both identical and different
+def synthetic_hits(n_queries=2000, seed=1):
+    rng = np.random.default_rng(seed)
+    hits_per_query = rng.integers(1, 6, n_queries)
+    hits_per_query[::10] = 1
+    query_index = np.repeat(np.arange(n_queries), hits_per_query)
+    df = pd.DataFrame({"qseqid": [f"q{i}" for i in query_index]})
+    for i, rank in enumerate(ranks):
+        taxa = np.array([f"{rank}_{j}" for j in range(10)] + ["Unknown"], dtype=object)
+        column = taxa[rng.integers(0, len(taxa), n_queries)][query_index]
+        other = rng.random(len(df)) < 0.03 * (i + 1)
+        column[other] = taxa[rng.integers(0, len(taxa), other.sum())]
+        column[rng.random(len(df)) < 0.03] = np.nan
+        df[rank] = column
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+# Define the LCA mask as it was computed before lca_mask
+def lambda_mask(df):
+    return df.groupby("qseqid")[ranks].transform(lambda x: len(set(x)) != 1)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_lca_mask_equals_lambda(seed):
+    df = synthetic_hits(seed=seed)
+    pd.testing.assert_frame_equal(lca_mask(df, ranks), lambda_mask(df))
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_lca_mask_of_encoded_ranks_equals_lambda(seed):
+    df = synthetic_hits(seed=seed)
+    encoded, _ = encode_ranks(df, ranks)
+    pd.testing.assert_frame_equal(lca_mask(encoded, ranks), lambda_mask(df))
+
+
+def test_single_hit_queries_are_not_masked():
+    df = synthetic_hits()
+    single = df.groupby("qseqid")["qseqid"].transform("size") == 1
+    assert single.any()
+    assert not lca_mask(df, ranks)[single].to_numpy().any()
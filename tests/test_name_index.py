@@ -0,0 +1,78 @@
+"""
+Tests of the name parsing of name_index.py: names of the NCBI_staxids_(non_)
+scientific.txt tables are parsed like the SILVA/CREST scripts parsed them with
+csv.reader (quotes removed), and names.dmp gives the same names as the tables
+made from it.
+
+Usage: python -m pytest tests/test_name_index.py
+"""
+
+import os
+import sys
+import csv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from name_index import NameIndex, read_name_tables, read_names_dmp
+
+# Define the names.dmp rows (staxid, name, name class), with quoted names, a name
+# with <genus>, and a name that is left out
+names_dmp_rows = [
+    (562, "Escherichia coli", "scientific name"),
+    (562, '"Bacterium coli"', "synonym"),
+    (1386, "Bacillus <bacterium>", "scientific name"),
+    (1386, '"Bacillus"', "synonym"),
+    (5, 'odd "quoted" name', "scientific name"),
+    (6, '"fully ""quoted"" name"', "scientific name"),
+    (7, "uncultured bacterium", "scientific name"),
+]
+
+
+# Define function to write the name tables the same way as
+# SILVA_SSU_LSU_makeblastdb_preparation.sh makes them from names.dmp
+def write_name_tables(tmp_path):
+    tables = {"scientific name": [], "other": []}
+    for staxid, name, name_class in names_dmp_rows:
+        name = name.replace(" <bacterium>", "")
+        if "uncultured" in name:
+            continue
+        table = "scientific name" if name_class == "scientific name" else "other"
+        tables[table].append(f"{name}\t{staxid}\n")
+    (tmp_path / "scientific.txt").write_text("".join(tables["scientific name"]))
+    (tmp_path / "non_scientific.txt").write_text("".join(tables["other"]))
+    return str(tmp_path / "scientific.txt"), str(tmp_path / "non_scientific.txt")
+
+
+# Define function to read in a name table as the SILVA/CREST scripts did
+def csv_reader_names(names_file):
+    with open(names_file) as names:
+        reader = csv.reader((line.lower() for line in names), delimiter="\t")
+        return {row[0]: int(row[1]) for row in reader}
+
+
+def test_name_tables_are_parsed_like_csv_reader(tmp_path):
+    scientific, non_scientific = write_name_tables(tmp_path)
+    expected = csv_reader_names(non_scientific)
+    expected.update(csv_reader_names(scientific))
+    name2staxid = read_name_tables(scientific, non_scientific)
+    assert name2staxid == expected
+    assert name2staxid["bacterium coli"] == 562
+    assert name2staxid["bacillus"] == 1386
+    assert name2staxid['fully "quoted" name'] == 6
+
+
+def test_names_dmp_equals_name_tables(tmp_path):
+    with open(tmp_path / "names.dmp", "w") as names_dmp:
+        for staxid, name, name_class in names_dmp_rows:
+            names_dmp.write(f"{staxid}\t|\t{name}\t|\t\t|\t{name_class}\t|\n")
+    name2staxid = read_names_dmp(str(tmp_path / "names.dmp"))
+    assert name2staxid == read_name_tables(*write_name_tables(tmp_path))
+    assert "uncultured bacterium" not in name2staxid
+
+
+def test_quoted_names_are_found(tmp_path):
+    index = NameIndex.from_names(read_name_tables(*write_name_tables(tmp_path)))
+    assert index.lookup(["bacterium coli", "bacillus", '"bacillus"']).tolist() == [
+        562,
+        1386,
+        0,
+    ]
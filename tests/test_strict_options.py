@@ -0,0 +1,76 @@
+"""
+Test that the -p/--percentage, -l/--length and -b/--bitscore options of
+blast_filter.py change which hits strict mode keeps.
+
+Usage: python -m pytest tests/test_strict_options.py
+"""
+
+import os
+import sys
+import subprocess
+import pandas as pd
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+ranks = ["superkingdom", "phylum", "class", "order", "family", "genus", "species"]
+
+# q1: the 3rd hit (185) is within 10 % but not within 2 % of the best bitscore,
+# and has another genus and species.
+# q2: one short (90) hit with a low bitscore (150), below the defaults -l 100 and
+# -b 155
+hits = [
+    ["q1", 100.0, 300, 200.0, "g1", "s1"],
+    ["q1", 100.0, 300, 197.0, "g1", "s1"],
+    ["q1", 100.0, 300, 185.0, "g2", "s2"],
+    ["q2", 100.0, 90, 150.0, "g3", "s3"],
+]
+
+
+# Define function to run blast_filter.py in strict mode with options, returns
+# the genus and species of each sequence
+def run_strict(tmp_path, *options):
+    df = pd.DataFrame(
+        [
+            [qseqid, pident, length, bitscore, "Bacteria", "p", "c", "o", "f"]
+            + taxa
+            for qseqid, pident, length, bitscore, *taxa in hits
+        ],
+        columns=["qseqid", "pident", "length", "bitscore"] + ranks,
+    )
+    df.to_csv(tmp_path / "hits.csv", index=False)
+    subprocess.run(
+        [
+            sys.executable,
+            os.path.join(repo, "blast_filter.py"),
+            str(tmp_path / "hits.csv"),
+            "strict",
+            "-o",
+            str(tmp_path / "filtered.csv"),
+            *options,
+        ],
+        check=True,
+        capture_output=True,
+    )
+    filtered = pd.read_csv(tmp_path / "filtered.csv", keep_default_na=False)
+    return {
+        row.sequence_name: (row.genus, row.species)
+        for row in filtered.itertuples()
+    }
+
+
+def test_defaults(tmp_path):
+    assert run_strict(tmp_path) == {"q1": ("g1", "s1"), "q2": ("NA", "NA")}
+
+
+def test_percentage(tmp_path):
+    assert run_strict(tmp_path, "-p", "10")["q1"] == ("NA", "NA")
+    assert run_strict(tmp_path, "-p", "1")["q1"] == ("g1", "s1")
+
+
+def test_length(tmp_path):
+    assert run_strict(tmp_path, "-l", "90")["q2"] == ("g3", "s3")
+
+
+def test_bitscore(tmp_path):
+    assert run_strict(tmp_path, "-b", "150")["q2"] == ("g3", "s3")
+    assert run_strict(tmp_path, "-b", "151")["q2"] == ("NA", "NA")